@@ -0,0 +1,113 @@
+import asyncio
+import logging
+from typing import Any, Awaitable, Callable
+
+from aiogram import BaseMiddleware
+from aiogram.types import TelegramObject, Update
+
+try:
+    from .db import write_backlog
+    from .operators import operator_pool
+    from .metrics import registry
+except ImportError:
+    from db import write_backlog
+    from operators import operator_pool
+    from metrics import registry
+
+logger = logging.getLogger(__name__)
+
+# Апдейты одного игрока обрабатываются по очереди (замки по user_id % LOCK_STRIPES),
+# разные игроки — параллельно
+LOCK_STRIPES = 256
+# Сверх USER_MAX_QUEUED апдейтов одного игрока (в работе + ждут) отбрасываются сразу
+USER_MAX_QUEUED = 5
+# Одновременно в обработчиках
+GLOBAL_MAX_INFLIGHT = 64
+# Если к писателю БД стоит больше транзакций, новые апдейты игроков не принимаем
+SHED_WRITE_BACKLOG = 200
+
+# Причины отказа
+USER_QUEUE = "user_queue"
+DB_BACKLOG = "db_backlog"
+
+Handler = Callable[[TelegramObject, dict[str, Any]], Awaitable[Any]]
+
+
+class AdmissionMiddleware(BaseMiddleware):
+    # Внешний middleware на dp.update: решает до FSM-обработчиков и запросов к БД.
+    # Админ и операторы не ограничиваются (кроме общего лимита); части альбома
+    # идут мимо замка и очереди игрока — их собирает album_collector.
+
+    def __init__(self):
+        self._locks = [asyncio.Lock() for _ in range(LOCK_STRIPES)]
+        self._queued: dict[int, int] = {}
+        self._slots = asyncio.Semaphore(GLOBAL_MAX_INFLIGHT)
+        self.inflight = 0
+        self.waiting = 0
+        self.stats = {USER_QUEUE: 0, DB_BACKLOG: 0}
+
+    def __len__(self) -> int:
+        return len(self._queued)
+
+    async def __call__(self, handler: Handler, event: TelegramObject, data: dict[str, Any]) -> Any:
+        user = data.get("event_from_user")
+        if user is None or user.id == data["config"]["admin_id"] or operator_pool.is_operator(user.id):
+            return await self._run(handler, event, data)
+
+        if write_backlog() > SHED_WRITE_BACKLOG:
+            return self._shed(DB_BACKLOG, user.id)
+
+        if _is_album_part(event):
+            return await self._run(handler, event, data)
+
+        queued = self._queued.get(user.id, 0)
+        if queued >= USER_MAX_QUEUED:
+            return self._shed(USER_QUEUE, user.id)
+
+        self._queued[user.id] = queued + 1
+        lock = self._locks[user.id % LOCK_STRIPES]
+        try:
+            self.waiting += 1
+            try:
+                await lock.acquire()
+            finally:
+                self.waiting -= 1
+            try:
+                # FSM-middleware прочитал состояние до нашей очереди — перечитываем под замком
+                if "state" in data:
+                    data["raw_state"] = await data["state"].get_state()
+                return await self._run(handler, event, data)
+            finally:
+                lock.release()
+        finally:
+            left = self._queued[user.id] - 1
+            if left:
+                self._queued[user.id] = left
+            else:
+                del self._queued[user.id]
+
+    async def _run(self, handler: Handler, event: TelegramObject, data: dict[str, Any]) -> Any:
+        async with self._slots:
+            self.inflight += 1
+            try:
+                return await handler(event, data)
+            finally:
+                self.inflight -= 1
+
+    def _shed(self, reason: str, user_id: int):
+        # апдейт считается обработанным: Telegram его не повторит
+        self.stats[reason] += 1
+        logger.debug("event=update_shed reason=%s user_id=%s", reason, user_id)
+
+
+def _is_album_part(event: TelegramObject) -> bool:
+    message = event.message if isinstance(event, Update) else None
+    return message is not None and message.media_group_id is not None
+
+
+admission = AdmissionMiddleware()
+
+registry.counter("bot_admission_shed_total", "Updates dropped before any handler ran", ("reason",), fn=lambda: admission.stats)
+registry.gauge("bot_admission_inflight", "Updates inside handlers", fn=lambda: admission.inflight)
+registry.gauge("bot_admission_waiting", "Updates waiting for their user's turn", fn=lambda: admission.waiting)
+registry.gauge("bot_admission_users_queued", "Users with updates in flight or waiting", fn=lambda: len(admission))
@@ -0,0 +1,151 @@
+import asyncio
+import logging
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Optional
+
+from aiogram.methods import (
+    SendAnimation, SendAudio, SendDocument, SendMediaGroup, SendPhoto,
+    SendSticker, SendVideo, SendVideoNote, SendVoice,
+)
+from aiogram.methods.base import TelegramMethod
+from aiogram.types import InputMediaAudio, InputMediaDocument, InputMediaPhoto, InputMediaVideo, Message
+
+try:
+    from .metrics import registry
+except ImportError:
+    from metrics import registry
+
+logger = logging.getLogger(__name__)
+
+# Вложения хранятся только как file_id Telegram: байты не скачиваются
+# и не загружаются заново, админу уходит тот же файл по id.
+
+# Порядок важен: у анимации заполнено и поле document
+ATTACHMENT_KINDS = ("photo", "video", "animation", "document", "audio", "voice", "video_note", "sticker")
+
+SEND_METHODS = {
+    "photo": (SendPhoto, "photo"),
+    "video": (SendVideo, "video"),
+    "animation": (SendAnimation, "animation"),
+    "document": (SendDocument, "document"),
+    "audio": (SendAudio, "audio"),
+    "voice": (SendVoice, "voice"),
+    "video_note": (SendVideoNote, "video_note"),
+    "sticker": (SendSticker, "sticker"),
+}
+
+# Что можно отправить одним альбомом (send_media_group)
+MEDIA_GROUP_TYPES = {
+    "photo": InputMediaPhoto,
+    "video": InputMediaVideo,
+    "document": InputMediaDocument,
+    "audio": InputMediaAudio,
+}
+MEDIA_GROUP_MAX = 10
+
+# Части альбома приходят отдельными апдейтами почти одновременно:
+# ждём, пока новых частей не будет ALBUM_WINDOW_SEC, но не дольше ALBUM_MAX_WAIT_SEC
+ALBUM_WINDOW_SEC = 0.6
+ALBUM_MAX_WAIT_SEC = 3
+# Уже собранные альбомы: опоздавшие части не создают вторую заявку
+MAX_DONE_ALBUMS = 1000
+
+
+def extract_attachment(message: Message) -> Optional[dict]:
+    for kind in ATTACHMENT_KINDS:
+        media = getattr(message, kind)
+        if not media:
+            continue
+        if kind == "photo":
+            media = media[-1]  # самый крупный размер
+        return {"kind": kind, "file_id": media.file_id, "file_unique_id": media.file_unique_id}
+    return None
+
+
+def attachment_methods(chat_id: int, attachments: list[dict], reply_to: Optional[int] = None) -> list[TelegramMethod]:
+    # Подряд идущие вложения, которые можно сгруппировать, уходят одним send_media_group
+    # (документы и аудио — только со своим типом), остальное — по одному
+    methods: list[TelegramMethod] = []
+    group: list[dict] = []
+
+    def flush():
+        if len(group) == 1:
+            single(group[0])
+        elif group:
+            media = [MEDIA_GROUP_TYPES[a["kind"]](media=a["file_id"]) for a in group]
+            methods.append(SendMediaGroup(chat_id=chat_id, media=media, reply_to_message_id=reply_to))
+        group.clear()
+
+    def single(a: dict):
+        method, arg = SEND_METHODS[a["kind"]]
+        methods.append(method(chat_id=chat_id, reply_to_message_id=reply_to, **{arg: a["file_id"]}))
+
+    def family(kind: str) -> str:
+        return "visual" if kind in ("photo", "video") else kind
+
+    for a in attachments:
+        if a["kind"] not in MEDIA_GROUP_TYPES:
+            flush()
+            single(a)
+            continue
+        if group and (family(group[0]["kind"]) != family(a["kind"]) or len(group) == MEDIA_GROUP_MAX):
+            flush()
+        group.append(a)
+    flush()
+    return methods
+
+
+@dataclass
+class _Album:
+    parts: list[Message]
+    started: float
+    touched: float
+
+
+class AlbumCollector:
+    # Первая часть альбома становится «ведущей»: ждёт остальные и получает
+    # их все одним списком, остальные части сразу получают None.
+
+    def __init__(self, window_sec: float = ALBUM_WINDOW_SEC, max_wait_sec: float = ALBUM_MAX_WAIT_SEC):
+        self._window_sec = window_sec
+        self._max_wait_sec = max_wait_sec
+        self._albums: dict[tuple[int, str], _Album] = {}
+        self._done: OrderedDict[tuple[int, str], None] = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._albums)
+
+    async def collect(self, message: Message) -> Optional[list[Message]]:
+        key = (message.chat.id, message.media_group_id)
+        loop = asyncio.get_running_loop()
+
+        album = self._albums.get(key)
+        if album is not None:
+            album.parts.append(message)
+            album.touched = loop.time()
+            return None
+        if key in self._done:
+            logger.warning("event=album_late_part chat_id=%s media_group_id=%s", *key)
+            return None
+
+        now = loop.time()
+        album = self._albums[key] = _Album([message], now, now)
+        try:
+            while True:
+                delay = min(album.touched + self._window_sec, album.started + self._max_wait_sec) - loop.time()
+                if delay <= 0:
+                    break
+                await asyncio.sleep(delay)
+        finally:
+            del self._albums[key]
+            self._done[key] = None
+            while len(self._done) > MAX_DONE_ALBUMS:
+                self._done.popitem(last=False)
+
+        return sorted(album.parts, key=lambda m: m.message_id)
+
+
+album_collector = AlbumCollector()
+
+registry.gauge("bot_albums_collecting", "Albums waiting for the rest of their parts", fn=lambda: len(album_collector))
@@ -0,0 +1,141 @@
+import asyncio
+import contextlib
+import logging
+import time
+from typing import Optional
+
+from aiogram.exceptions import TelegramBadRequest
+from aiogram.methods import EditMessageText, PinChatMessage
+
+try:
+    from .db import list_open_tickets, count_open_tickets, get_meta, set_meta, on_tickets_changed
+    from .keyboards import queue_board_kb
+    from .outbox import outbox, PRIORITY_NOTIFY
+    from .scheduler import REMIND_AFTER_SEC
+except ImportError:
+    from db import list_open_tickets, count_open_tickets, get_meta, set_meta, on_tickets_changed
+    from keyboards import queue_board_kb
+    from outbox import outbox, PRIORITY_NOTIFY
+    from scheduler import REMIND_AFTER_SEC
+
+logger = logging.getLogger(__name__)
+
+# Все изменения за это окно попадают в одну правку сообщения
+BOARD_DEBOUNCE_SEC = 1
+# Без изменений доска всё равно обновляется (возраст заявок растёт)
+BOARD_REFRESH_SEC = 60
+BOARD_MAX_ROWS = 30
+BOARD_MAX_BUTTONS = 10
+BOARD_META_KEY = "queue_board"
+
+# Лимит длины текста сообщения в Bot API
+MAX_TEXT_LEN = 4096
+
+
+def _status(ticket: dict, now: int) -> str:
+    if ticket["last_admin_reply_ts"] is not None:
+        return "💬"
+    if ticket["last_admin_remind_ts"] is not None or now - ticket["created_ts"] >= REMIND_AFTER_SEC:
+        return "⏰"
+    return "🆕"
+
+
+def render_board(tickets: list[dict], total: int, now: int) -> str:
+    if not total:
+        return "📋 Очередь пуста — открытых заявок нет."
+
+    lines = [f"📋 Открытых заявок: {total}", "🆕 новая · ⏰ ждёт ответа · 💬 есть ответ", ""]
+    for t in tickets:
+        uname = f"@{t['username']}" if t["username"] else ""
+        age_min = max(0, now - t["created_ts"]) // 60
+        lines.append(f"{_status(t, now)} #{t['id']} · {age_min} мин · {t['user_id']} {uname}".rstrip())
+    if total > len(tickets):
+        lines.append(f"… и ещё {total - len(tickets)}")
+    return "\n".join(lines)[:MAX_TEXT_LEN]
+
+
+class QueueBoard:
+    # Одно закреплённое сообщение у админа со списком открытых заявок.
+    # db.py только помечает доску «грязной», а правка идёт из фоновой задачи
+    # не чаще раза в BOARD_DEBOUNCE_SEC и только если текст изменился.
+
+    def __init__(self):
+        self._chat_id: Optional[int] = None
+        self._message_id: Optional[int] = None
+        self._dirty = asyncio.Event()
+        self._shown: Optional[tuple[str, list[int]]] = None
+        on_tickets_changed(self.mark_dirty)
+
+    @property
+    def enabled(self) -> bool:
+        return self._chat_id is not None
+
+    def covers(self, chat_id: int) -> bool:
+        # напоминания и автоочистка для этого чата видны на доске
+        return self.enabled and chat_id == self._chat_id
+
+    def is_board_message(self, chat_id: int, message_id: int) -> bool:
+        return self.enabled and (chat_id, message_id) == (self._chat_id, self._message_id)
+
+    def mark_dirty(self):
+        if self.enabled:
+            self._dirty.set()
+
+    async def start(self, chat_id: int):
+        # Включает доску; обновляет её только ведущий процесс через run()
+        self._chat_id = chat_id
+        saved = await get_meta(BOARD_META_KEY)
+        if saved:
+            saved_chat, saved_message = map(int, saved.split(":"))
+            if saved_chat == chat_id:
+                self._message_id = saved_message
+
+    async def refresh(self):
+        now = int(time.time())
+        tickets = await list_open_tickets(limit=BOARD_MAX_ROWS)
+        total = await count_open_tickets()
+        text = render_board(tickets, total, now)
+        ids = [t["id"] for t in tickets[:BOARD_MAX_BUTTONS]]
+        if (text, ids) == self._shown:
+            return
+
+        markup = queue_board_kb(ids)
+        if self._message_id is not None:
+            try:
+                await outbox.submit(
+                    EditMessageText(chat_id=self._chat_id, message_id=self._message_id, text=text, reply_markup=markup),
+                    PRIORITY_NOTIFY
+                )
+            except TelegramBadRequest as e:
+                # сообщение удалили или его больше нельзя править — публикуем новое
+                if "not modified" not in str(e):
+                    self._message_id = None
+
+        if self._message_id is None:
+            sent = await outbox.send_message(self._chat_id, text, reply_markup=markup, priority=PRIORITY_NOTIFY)
+            self._message_id = sent.message_id
+            await set_meta(BOARD_META_KEY, f"{self._chat_id}:{self._message_id}")
+            with contextlib.suppress(Exception):
+                await outbox.submit(
+                    PinChatMessage(chat_id=self._chat_id, message_id=self._message_id, disable_notification=True),
+                    PRIORITY_NOTIFY
+                )
+
+        self._shown = (text, ids)
+
+    async def run(self):
+        # при смене ведущего перерисовываем сразу, не дожидаясь изменений
+        self._shown = None
+        self._dirty.set()
+        while True:
+            with contextlib.suppress(asyncio.TimeoutError):
+                await asyncio.wait_for(self._dirty.wait(), BOARD_REFRESH_SEC)
+            await asyncio.sleep(BOARD_DEBOUNCE_SEC)
+            self._dirty.clear()
+            try:
+                await self.refresh()
+            except Exception:
+                logger.exception("event=board_error chat_id=%s message_id=%s", self._chat_id, self._message_id)
+
+
+queue_board = QueueBoard()
@@ -1,12 +1,242 @@
+import asyncio
+import contextlib
+import functools
+import json
+import re
+import time
+import zlib
 import aiosqlite
-from typing import Optional
+from typing import Any, Awaitable, Callable, Optional, Sequence
+
+try:
+    from .scheduler import ticket_scheduler
+    from .support_bridge import ADMIN_MSG_TO_TICKET
+    from .operators import operator_pool
+    from .ticket_cache import ticket_cache
+    from .stats import support_stats
+    from .metrics import registry, DB_SECONDS, DB_ERRORS, DB_WAIT_SECONDS
+except ImportError:
+    from scheduler import ticket_scheduler
+    from support_bridge import ADMIN_MSG_TO_TICKET
+    from operators import operator_pool
+    from ticket_cache import ticket_cache
+    from stats import support_stats
+    from metrics import registry, DB_SECONDS, DB_ERRORS, DB_WAIT_SECONDS
 
 DB_PATH = "bot.db"
 
+# Одно долгоживущее соединение на запись + небольшой пул читателей.
+# Открываются один раз в init_db(), закрываются в close_db().
+READER_POOL_SIZE = 4
+STATEMENT_CACHE_SIZE = 256
 
-async def init_db():
-    async with aiosqlite.connect(DB_PATH) as db:
-        await db.execute("""
+# Сколько заявок обрабатывает одна пакетная операция фоновой очистки
+SWEEP_CHUNK = 500
+# Верхняя граница одной массовой операции админа (close_tickets)
+BULK_MAX = 1000
+
+# Групповой коммит: заявки, пришедшие в пределах окна, пишутся одной транзакцией
+GROUP_COMMIT_WINDOW_SEC = 0.005
+GROUP_COMMIT_MAX_BATCH = 64
+
+# Закрытые заявки: open -> closed (админ), deleted (кнопка «удалить»), expired (TTL)
+CLOSED_STATUSES = ("closed", "deleted", "expired")
+
+# Архив: текст заявки хранится сжатым (codec 1) или как есть, если сжатие не помогло
+CODEC_RAW = 0
+CODEC_ZLIB = 1
+ARCHIVE_ZLIB_LEVEL = 6
+# Сколько работы делает одно обслуживание: страниц FTS-слияния и освобождаемых страниц файла
+FTS_MERGE_PAGES = 500
+VACUUM_PAGES = 2000
+
+PRAGMAS = (
+    # действует только для нового файла (до перевода в WAL); старой базе нужен один VACUUM
+    "PRAGMA auto_vacuum=INCREMENTAL",
+    "PRAGMA journal_mode=WAL",
+    "PRAGMA synchronous=NORMAL",
+    "PRAGMA cache_size=-16000",      # ~16 МБ страничного кэша на соединение
+    "PRAGMA mmap_size=134217728",   # 128 МБ
+    "PRAGMA temp_store=MEMORY",
+    "PRAGMA busy_timeout=5000",
+)
+
+_writer: Optional[aiosqlite.Connection] = None
+_write_lock: Optional[asyncio.Lock] = None
+_readers: Optional[asyncio.Queue] = None
+
+_group_pending: list[tuple[Callable[[aiosqlite.Connection], Awaitable[Any]], asyncio.Future]] = []
+_group_flusher: Optional[asyncio.Task] = None
+# Сколько транзакций ждут _write_lock
+_write_waiting = 0
+
+registry.gauge("bot_db_group_pending", "Writes waiting for the next group commit", fn=lambda: len(_group_pending))
+registry.gauge("bot_db_write_waiting", "Transactions waiting for the writer", fn=lambda: _write_waiting)
+
+
+def write_backlog() -> int:
+    # Очередь к единственному писателю: для отсечения нагрузки (admission.py)
+    return len(_group_pending) + _write_waiting
+
+
+def _timed(fn):
+    # Время каждого публичного вызова (вместе с ожиданием соединения) и ошибки
+    op = fn.__name__
+
+    @functools.wraps(fn)
+    async def wrapper(*args, **kwargs):
+        started = time.perf_counter()
+        try:
+            return await fn(*args, **kwargs)
+        except Exception:
+            DB_ERRORS.inc(op)
+            raise
+        finally:
+            DB_SECONDS.observe(time.perf_counter() - started, op)
+
+    return wrapper
+
+
+async def _connect(readonly: bool = False) -> aiosqlite.Connection:
+    # isolation_level=None: транзакциями управляем сами (см. _write)
+    db = await aiosqlite.connect(
+        DB_PATH,
+        isolation_level=None,
+        cached_statements=STATEMENT_CACHE_SIZE,
+    )
+    db.row_factory = aiosqlite.Row
+    for pragma in PRAGMAS:
+        await db.execute(pragma)
+    if readonly:
+        await db.execute("PRAGMA query_only=1")
+    return db
+
+
+async def _open_pool():
+    global _writer, _write_lock, _readers
+    if _writer is not None:
+        return
+
+    _writer = await _connect()
+    _write_lock = asyncio.Lock()
+    _readers = asyncio.Queue()
+    for _ in range(READER_POOL_SIZE):
+        _readers.put_nowait(await _connect(readonly=True))
+
+
+async def close_db():
+    global _writer, _write_lock, _readers
+    if _writer is None:
+        return
+
+    if _group_flusher is not None:
+        await asyncio.gather(_group_flusher, return_exceptions=True)
+
+    async with _write_lock:
+        with contextlib.suppress(Exception):
+            await _writer.execute("PRAGMA optimize")
+        await _writer.close()
+    while not _readers.empty():
+        await _readers.get_nowait().close()
+
+    _writer = _write_lock = _readers = None
+
+
+@contextlib.asynccontextmanager
+async def _read():
+    started = time.perf_counter()
+    db = await _readers.get()
+    DB_WAIT_SECONDS.observe(time.perf_counter() - started, "read")
+    try:
+        yield db
+    finally:
+        _readers.put_nowait(db)
+
+
+@contextlib.asynccontextmanager
+async def _write():
+    # Все записи идут через одно соединение и одну транзакцию за раз
+    global _write_waiting
+    started = time.perf_counter()
+    _write_waiting += 1
+    try:
+        await _write_lock.acquire()
+    finally:
+        _write_waiting -= 1
+    try:
+        DB_WAIT_SECONDS.observe(time.perf_counter() - started, "write")
+        await _writer.execute("BEGIN IMMEDIATE")
+        try:
+            yield _writer
+        except BaseException:
+            await _writer.execute("ROLLBACK")
+            raise
+        await _writer.execute("COMMIT")
+    finally:
+        _write_lock.release()
+
+
+async def _group_write(op: Callable[[aiosqlite.Connection], Awaitable[Any]]) -> Any:
+    # op(db) выполняется в своём SAVEPOINT внутри общей транзакции пачки:
+    # ошибка одной операции откатывает только её. Результат отдаётся после COMMIT.
+    global _group_flusher
+    future = asyncio.get_running_loop().create_future()
+    _group_pending.append((op, future))
+    if _group_flusher is None or _group_flusher.done():
+        _group_flusher = asyncio.create_task(_flush_group())
+    return await future
+
+
+async def _flush_group():
+    await asyncio.sleep(GROUP_COMMIT_WINDOW_SEC)
+
+    while _group_pending:
+        batch = _group_pending[:GROUP_COMMIT_MAX_BATCH]
+        del _group_pending[:GROUP_COMMIT_MAX_BATCH]
+
+        outcomes = []
+        try:
+            async with _write() as db:
+                for op, future in batch:
+                    await db.execute("SAVEPOINT grp")
+                    try:
+                        result = await op(db)
+                    except Exception as e:
+                        await db.execute("ROLLBACK TO grp")
+                        await db.execute("RELEASE grp")
+                        outcomes.append((future, None, e))
+                    else:
+                        await db.execute("RELEASE grp")
+                        outcomes.append((future, result, None))
+        except Exception as e:
+            outcomes = [(future, None, e) for _, future in batch]
+
+        for future, result, error in outcomes:
+            if future.done():
+                continue
+            if error is None:
+                future.set_result(result)
+            else:
+                future.set_exception(error)
+
+
+async def _fetchone(sql: str, params: tuple = ()) -> Optional[aiosqlite.Row]:
+    async with _read() as db:
+        async with db.execute(sql, params) as cur:
+            return await cur.fetchone()
+
+
+async def _fetchall(sql: str, params: tuple = ()) -> list[aiosqlite.Row]:
+    async with _read() as db:
+        return list(await db.execute_fetchall(sql, params))
+
+
+# Миграции схемы. Номер шага = индекс в списке + 1, текущая версия
+# хранится в PRAGMA user_version. Новые шаги только дописываются в конец.
+MIGRATIONS: list[tuple[str, ...]] = [
+    # 1: базовые таблицы
+    (
+        """
         CREATE TABLE IF NOT EXISTS tickets (
             id INTEGER PRIMARY KEY AUTOINCREMENT,
             user_id INTEGER NOT NULL,
@@ -18,106 +248,851 @@ async def init_db():
             last_admin_reply_ts INTEGER,
             last_admin_remind_ts INTEGER
         )
-        """)
-
-        await db.execute("""
+        """,
+        """
         CREATE TABLE IF NOT EXISTS user_limits (
             user_id INTEGER PRIMARY KEY,
             last_ticket_ts INTEGER NOT NULL DEFAULT 0,
             last_call_ts INTEGER NOT NULL DEFAULT 0
         )
-        """)
+        """,
+    ),
+    # 2: индексы под list_open_tickets, count_tickets_in_window и поиск просроченных
+    (
+        "CREATE INDEX IF NOT EXISTS idx_tickets_status_id ON tickets(status, id)",
+        "CREATE INDEX IF NOT EXISTS idx_tickets_user_created ON tickets(user_id, created_ts)",
+        "CREATE INDEX IF NOT EXISTS idx_tickets_open_created ON tickets(created_ts) WHERE status='open'",
+    ),
+    # 3: связь сообщений у админа с заявками; чистится вместе с заявкой
+    (
+        """
+        CREATE TABLE IF NOT EXISTS admin_messages (
+            chat_id INTEGER NOT NULL,
+            message_id INTEGER NOT NULL,
+            ticket_id INTEGER NOT NULL,
+            PRIMARY KEY (chat_id, message_id)
+        ) WITHOUT ROWID
+        """,
+        "CREATE INDEX IF NOT EXISTS idx_admin_messages_ticket ON admin_messages(ticket_id)",
+        """
+        CREATE TRIGGER IF NOT EXISTS trg_tickets_delete_admin_messages
+        AFTER DELETE ON tickets
+        BEGIN
+            DELETE FROM admin_messages WHERE ticket_id = old.id;
+        END
+        """,
+    ),
+    # 4: состояния FSM (см. fsm_storage.py)
+    (
+        """
+        CREATE TABLE IF NOT EXISTS fsm_state (
+            bot_id INTEGER NOT NULL,
+            chat_id INTEGER NOT NULL,
+            user_id INTEGER NOT NULL,
+            thread_id INTEGER NOT NULL DEFAULT 0,
+            destiny TEXT NOT NULL,
+            state TEXT,
+            data TEXT NOT NULL DEFAULT '{}',
+            updated_ts INTEGER NOT NULL,
+            PRIMARY KEY (bot_id, chat_id, user_id, thread_id, destiny)
+        ) WITHOUT ROWID
+        """,
+        "CREATE INDEX IF NOT EXISTS idx_fsm_state_updated ON fsm_state(updated_ts)",
+    ),
+    # 5: пул операторов и назначение заявок
+    (
+        """
+        CREATE TABLE IF NOT EXISTS operators (
+            user_id INTEGER PRIMARY KEY,
+            on_duty INTEGER NOT NULL DEFAULT 1,
+            added_ts INTEGER NOT NULL
+        )
+        """,
+        "ALTER TABLE tickets ADD COLUMN assigned_to INTEGER",
+        "CREATE INDEX IF NOT EXISTS idx_tickets_assigned_open ON tickets(assigned_to, id) WHERE status='open'",
+    ),
+    # 6: служебные значения (id сообщения доски очереди и т.п.)
+    (
+        """
+        CREATE TABLE IF NOT EXISTS meta (
+            key TEXT PRIMARY KEY,
+            value TEXT
+        ) WITHOUT ROWID
+        """,
+    ),
+    # 7: аренды для выбора ведущего процесса (см. leader.py)
+    (
+        """
+        CREATE TABLE IF NOT EXISTS leases (
+            name TEXT PRIMARY KEY,
+            holder TEXT NOT NULL,
+            expires_ts REAL NOT NULL
+        ) WITHOUT ROWID
+        """,
+    ),
+    # 8: полнотекстовый поиск по заявкам; индекс ведут триггеры
+    (
+        """
+        CREATE VIRTUAL TABLE IF NOT EXISTS tickets_fts USING fts5(
+            message, username,
+            content='tickets', content_rowid='id',
+            tokenize='unicode61 remove_diacritics 2'
+        )
+        """,
+        """
+        CREATE TRIGGER IF NOT EXISTS trg_tickets_fts_insert AFTER INSERT ON tickets
+        BEGIN
+            INSERT INTO tickets_fts (rowid, message, username) VALUES (new.id, new.message, new.username);
+        END
+        """,
+        """
+        CREATE TRIGGER IF NOT EXISTS trg_tickets_fts_delete AFTER DELETE ON tickets
+        BEGIN
+            INSERT INTO tickets_fts (tickets_fts, rowid, message, username)
+            VALUES ('delete', old.id, old.message, old.username);
+        END
+        """,
+        """
+        CREATE TRIGGER IF NOT EXISTS trg_tickets_fts_update AFTER UPDATE OF message, username ON tickets
+        BEGIN
+            INSERT INTO tickets_fts (tickets_fts, rowid, message, username)
+            VALUES ('delete', old.id, old.message, old.username);
+            INSERT INTO tickets_fts (rowid, message, username) VALUES (new.id, new.message, new.username);
+        END
+        """,
+        "INSERT INTO tickets_fts (tickets_fts) VALUES ('rebuild')",
+    ),
+    # 9: закрытые заявки остаются в tickets со статусом и closed_ts,
+    # потом пачками уезжают в tickets_archive (см. archive_tickets)
+    (
+        "ALTER TABLE tickets ADD COLUMN closed_ts INTEGER",
+        "CREATE INDEX IF NOT EXISTS idx_tickets_closed ON tickets(closed_ts) WHERE status<>'open'",
+        """
+        CREATE TABLE IF NOT EXISTS tickets_archive (
+            id INTEGER PRIMARY KEY,
+            user_id INTEGER NOT NULL,
+            username TEXT,
+            status TEXT NOT NULL,
+            message BLOB NOT NULL,
+            codec INTEGER NOT NULL,
+            created_ts INTEGER NOT NULL,
+            created_at TEXT NOT NULL,
+            last_admin_reply_ts INTEGER,
+            last_admin_remind_ts INTEGER,
+            assigned_to INTEGER,
+            closed_ts INTEGER NOT NULL
+        )
+        """,
+        "CREATE INDEX IF NOT EXISTS idx_tickets_archive_closed ON tickets_archive(closed_ts)",
+    ),
+    # 10: вложения заявок (file_id Telegram); живут, пока заявка есть в tickets или архиве
+    (
+        """
+        CREATE TABLE IF NOT EXISTS attachments (
+            ticket_id INTEGER NOT NULL,
+            position INTEGER NOT NULL,
+            kind TEXT NOT NULL,
+            file_id TEXT NOT NULL,
+            file_unique_id TEXT,
+            PRIMARY KEY (ticket_id, position)
+        ) WITHOUT ROWID
+        """,
+    ),
+    # 11: почасовые агрегаты статистики (см. stats.py); значения только прибавляются
+    (
+        """
+        CREATE TABLE IF NOT EXISTS stats_rollup (
+            bucket_ts INTEGER NOT NULL,
+            metric TEXT NOT NULL,
+            key INTEGER NOT NULL DEFAULT 0,
+            value INTEGER NOT NULL,
+            PRIMARY KEY (bucket_ts, metric, key)
+        ) WITHOUT ROWID
+        """,
+    ),
+]
+
+
+async def _migrate():
+    async with _write() as db:
+        async with db.execute("PRAGMA user_version") as cur:
+            (version,) = await cur.fetchone()
+
+        for number, steps in enumerate(MIGRATIONS[version:], start=version + 1):
+            for sql in steps:
+                await db.execute(sql)
+            await db.execute(f"PRAGMA user_version={number}")
+
+
+async def init_db():
+    await _open_pool()
+    await _migrate()
+
+
+# ---------- hooks ----------
+# Состояние в памяти (планировщик, кэши, пул операторов) обновляется
+# только после успешного COMMIT.
 
-        await db.commit()
+# Подписчики на любое изменение открытых заявок (доска очереди).
+# Вызываются синхронно, поэтому должны только ставить флаг.
+_change_listeners: list[Callable[[], None]] = []
+
+def on_tickets_changed(callback: Callable[[], None]):
+    _change_listeners.append(callback)
+
+def _tickets_changed():
+    for callback in _change_listeners:
+        callback()
+
+def _ticket_opened(ticket_id: int, user_id: int, created_ts: int, assigned_to: Optional[int]):
+    ticket_scheduler.add(ticket_id, created_ts)
+    support_stats.opened(user_id, created_ts)
+    operator_pool.assigned(assigned_to)
+    ticket_cache.forget(ticket_id)
+    _tickets_changed()
+
+def _ticket_closed(ticket_id: int, assigned_to: Optional[int]):
+    ticket_scheduler.remove(ticket_id)
+    ADMIN_MSG_TO_TICKET.forget_ticket(ticket_id)
+    operator_pool.released(assigned_to)
+    ticket_cache.forget(ticket_id)
+    _tickets_changed()
 
 
 # ---------- user limits ----------
 
+@_timed
 async def ensure_user_limits(user_id: int):
-    async with aiosqlite.connect(DB_PATH) as db:
+    async with _write() as db:
         await db.execute(
             "INSERT OR IGNORE INTO user_limits (user_id, last_ticket_ts, last_call_ts) VALUES (?, 0, 0)",
             (user_id,)
         )
-        await db.commit()
 
+@_timed
 async def get_user_limits(user_id: int) -> dict:
-    await ensure_user_limits(user_id)
-    async with aiosqlite.connect(DB_PATH) as db:
-        db.row_factory = aiosqlite.Row
-        cur = await db.execute("SELECT * FROM user_limits WHERE user_id=?", (user_id,))
-        row = await cur.fetchone()
-        return dict(row)
+    row = await _fetchone("SELECT * FROM user_limits WHERE user_id=?", (user_id,))
+    if row is None:
+        await ensure_user_limits(user_id)
+        return {"user_id": user_id, "last_ticket_ts": 0, "last_call_ts": 0}
+    return dict(row)
 
+@_timed
 async def set_last_ticket_ts(user_id: int, ts: int):
-    await ensure_user_limits(user_id)
-    async with aiosqlite.connect(DB_PATH) as db:
-        await db.execute("UPDATE user_limits SET last_ticket_ts=? WHERE user_id=?", (ts, user_id))
-        await db.commit()
+    async with _write() as db:
+        await db.execute(
+            """INSERT INTO user_limits (user_id, last_ticket_ts, last_call_ts) VALUES (?, ?, 0)
+               ON CONFLICT(user_id) DO UPDATE SET last_ticket_ts=excluded.last_ticket_ts""",
+            (user_id, ts)
+        )
 
+@_timed
 async def set_last_call_ts(user_id: int, ts: int):
-    await ensure_user_limits(user_id)
-    async with aiosqlite.connect(DB_PATH) as db:
-        await db.execute("UPDATE user_limits SET last_call_ts=? WHERE user_id=?", (ts, user_id))
-        await db.commit()
+    async with _write() as db:
+        await db.execute(
+            """INSERT INTO user_limits (user_id, last_ticket_ts, last_call_ts) VALUES (?, 0, ?)
+               ON CONFLICT(user_id) DO UPDATE SET last_call_ts=excluded.last_call_ts""",
+            (user_id, ts)
+        )
 
-async def count_tickets_in_window(user_id: int, from_ts: int) -> int:
-    async with aiosqlite.connect(DB_PATH) as db:
-        cur = await db.execute(
-            "SELECT COUNT(*) FROM tickets WHERE user_id=? AND created_ts>=?",
-            (user_id, from_ts)
+@_timed
+async def load_recent_limits(since_ts: int) -> tuple[list[dict], list[dict]]:
+    # Для прогрева лимитера: свежие отметки из user_limits и время недавних заявок
+    limits = await _fetchall(
+        "SELECT * FROM user_limits WHERE last_ticket_ts>=? OR last_call_ts>=?",
+        (since_ts, since_ts)
+    )
+    tickets = await _fetchall(
+        "SELECT user_id, created_ts FROM tickets WHERE created_ts>=?",
+        (since_ts,)
+    )
+    return [dict(r) for r in limits], [dict(r) for r in tickets]
+
+@_timed
+async def save_user_limits(call_ts: dict[int, int]):
+    # last_ticket_ts сюда не входит: его ставит submit_ticket
+    async with _write() as db:
+        await db.executemany(
+            """INSERT INTO user_limits (user_id, last_ticket_ts, last_call_ts) VALUES (?, 0, ?)
+               ON CONFLICT(user_id) DO UPDATE SET last_call_ts=max(last_call_ts, excluded.last_call_ts)""",
+            call_ts.items()
         )
-        (cnt,) = await cur.fetchone()
-        return int(cnt)
+
+@_timed
+async def count_tickets_in_window(user_id: int, from_ts: int) -> int:
+    (cnt,) = await _fetchone(
+        "SELECT COUNT(*) FROM tickets WHERE user_id=? AND created_ts>=?",
+        (user_id, from_ts)
+    )
+    return int(cnt)
 
 
 # ---------- tickets ----------
 
-async def create_ticket(user_id: int, username: str | None, message: str, created_ts: int, created_at: str) -> int:
-    async with aiosqlite.connect(DB_PATH) as db:
-        cur = await db.execute(
-            """INSERT INTO tickets (user_id, username, status, message, created_ts, created_at)
-               VALUES (?, ?, 'open', ?, ?, ?)""",
-            (user_id, username, message, created_ts, created_at)
-        )
-        await db.commit()
+TICKET_COLUMNS = """id, user_id, username, status, message, created_ts, created_at,
+                    last_admin_reply_ts, last_admin_remind_ts, assigned_to, closed_ts"""
+
+INSERT_TICKET_SQL = """INSERT INTO tickets (user_id, username, status, message, created_ts, created_at, assigned_to)
+                        VALUES (?, ?, 'open', ?, ?, ?, ?)"""
+
+@_timed
+async def create_ticket(
+    user_id: int,
+    username: str | None,
+    message: str,
+    created_ts: int,
+    created_at: str,
+    assigned_to: Optional[int] = None,
+) -> int:
+    async def op(db: aiosqlite.Connection) -> int:
+        cur = await db.execute(INSERT_TICKET_SQL, (user_id, username, message, created_ts, created_at, assigned_to))
         return cur.lastrowid
 
+    ticket_id = await _group_write(op)
+    _ticket_opened(ticket_id, user_id, created_ts, assigned_to)
+    return ticket_id
+
+@_timed
+async def submit_ticket(
+    user_id: int,
+    username: str | None,
+    message: str,
+    created_ts: int,
+    created_at: str,
+    cooldown_sec: int,
+    window_sec: int,
+    max_per_window: int,
+    assigned_to: Optional[int] = None,
+    attachments: Sequence[dict] = (),
+) -> dict:
+    # Проверка лимитов, создание заявки с вложениями и отметка кулдауна — атомарно.
+    # Возвращает {"ticket_id": id | None, "reason": None | "cooldown" | "window", "wait": сек}
+    async def op(db: aiosqlite.Connection) -> dict:
+        async with db.execute("SELECT last_ticket_ts FROM user_limits WHERE user_id=?", (user_id,)) as cur:
+            row = await cur.fetchone()
+        last_ts = int(row[0]) if row else 0
+        if created_ts - last_ts < cooldown_sec:
+            return {"ticket_id": None, "reason": "cooldown", "wait": cooldown_sec - (created_ts - last_ts)}
+
+        if max_per_window:
+            async with db.execute(
+                "SELECT COUNT(*), MIN(created_ts) FROM tickets WHERE user_id=? AND created_ts>=?",
+                (user_id, created_ts - window_sec)
+            ) as cur:
+                cnt, first_ts = await cur.fetchone()
+            if cnt >= max_per_window:
+                return {"ticket_id": None, "reason": "window", "wait": int(first_ts) + window_sec - created_ts}
+
+        cur = await db.execute(INSERT_TICKET_SQL, (user_id, username, message, created_ts, created_at, assigned_to))
+        ticket_id = cur.lastrowid
+        if attachments:
+            await db.executemany(
+                """INSERT INTO attachments (ticket_id, position, kind, file_id, file_unique_id)
+                   VALUES (?, ?, ?, ?, ?)""",
+                [(ticket_id, i, a["kind"], a["file_id"], a.get("file_unique_id")) for i, a in enumerate(attachments)]
+            )
+        await db.execute(
+            """INSERT INTO user_limits (user_id, last_ticket_ts, last_call_ts) VALUES (?, ?, 0)
+               ON CONFLICT(user_id) DO UPDATE SET last_ticket_ts=excluded.last_ticket_ts""",
+            (user_id, created_ts)
+        )
+        return {"ticket_id": ticket_id, "reason": None, "wait": 0}
+
+    result = await _group_write(op)
+    if result["ticket_id"] is not None:
+        _ticket_opened(result["ticket_id"], user_id, created_ts, assigned_to)
+    return result
+
+@_timed
 async def get_ticket(ticket_id: int) -> Optional[dict]:
-    async with aiosqlite.connect(DB_PATH) as db:
-        db.row_factory = aiosqlite.Row
-        cur = await db.execute("SELECT * FROM tickets WHERE id = ?", (ticket_id,))
-        row = await cur.fetchone()
-        return dict(row) if row else None
+    cached, ticket = ticket_cache.get(ticket_id)
+    if cached:
+        return ticket
+
+    # Горячая таблица и архив одним запросом: перенос заявки между ними
+    # атомарен, так что она найдётся ровно в одном месте
+    token = ticket_cache.token()
+    row = await _fetchone(
+        f"""SELECT {TICKET_COLUMNS}, NULL AS codec FROM tickets WHERE id=?1
+            UNION ALL
+            SELECT {TICKET_COLUMNS}, codec FROM tickets_archive WHERE id=?1
+            LIMIT 1""",
+        (ticket_id,)
+    )
+    ticket = _ticket_from_row(row) if row else None
+    ticket_cache.put(ticket_id, ticket, token)
+    return ticket
 
+def _ticket_from_row(row: aiosqlite.Row) -> dict:
+    ticket = dict(row)
+    codec = ticket.pop("codec")
+    if codec is not None:
+        ticket["message"] = _unpack(codec, ticket["message"])
+    return ticket
+
+@_timed
+async def list_attachments(ticket_id: int) -> list[dict]:
+    rows = await _fetchall(
+        "SELECT kind, file_id, file_unique_id FROM attachments WHERE ticket_id=? ORDER BY position",
+        (ticket_id,)
+    )
+    return [dict(r) for r in rows]
+
+@_timed
 async def list_open_tickets(limit: int = 200) -> list[dict]:
-    async with aiosqlite.connect(DB_PATH) as db:
-        db.row_factory = aiosqlite.Row
-        cur = await db.execute(
-            "SELECT * FROM tickets WHERE status='open' ORDER BY id ASC LIMIT ?",
-            (limit,)
-        )
-        rows = await cur.fetchall()
-        return [dict(r) for r in rows]
+    rows = await _fetchall(
+        "SELECT * FROM tickets WHERE status='open' ORDER BY id ASC LIMIT ?",
+        (limit,)
+    )
+    return [dict(r) for r in rows]
+
+@_timed
+async def count_open_tickets() -> int:
+    (cnt,) = await _fetchone("SELECT COUNT(*) FROM tickets WHERE status='open'")
+    return int(cnt)
 
+@_timed
+async def list_open_ticket_timers() -> list[dict]:
+    # Все открытые заявки без лимита, только поля для планировщика
+    rows = await _fetchall(
+        """SELECT id, created_ts, last_admin_reply_ts, last_admin_remind_ts
+           FROM tickets WHERE status='open' ORDER BY id ASC"""
+    )
+    return [dict(r) for r in rows]
+
+@_timed
+async def get_open_tickets(ticket_ids: list[int]) -> list[dict]:
+    rows = await _fetchall(
+        "SELECT * FROM tickets WHERE id IN (SELECT value FROM json_each(?)) AND status='open' ORDER BY id",
+        (json.dumps(ticket_ids),)
+    )
+    return [dict(r) for r in rows]
+
+@_timed
 async def mark_admin_replied(ticket_id: int, ts: int):
-    async with aiosqlite.connect(DB_PATH) as db:
+    async with _write() as db:
+        async with db.execute(
+            "SELECT created_ts, last_admin_reply_ts FROM tickets WHERE id=?",
+            (ticket_id,)
+        ) as cur:
+            row = await cur.fetchone()
         await db.execute(
             "UPDATE tickets SET last_admin_reply_ts=? WHERE id=?",
             (ts, ticket_id)
         )
-        await db.commit()
+    if row is not None:
+        first = row["last_admin_reply_ts"] is None
+        support_stats.replied(ts, ts - row["created_ts"] if first else None)
+    ticket_scheduler.replied(ticket_id)
+    ticket_cache.update(ticket_id, last_admin_reply_ts=ts)
+    _tickets_changed()
 
+@_timed
 async def mark_admin_reminded(ticket_id: int, ts: int):
-    async with aiosqlite.connect(DB_PATH) as db:
+    async with _write() as db:
         await db.execute(
             "UPDATE tickets SET last_admin_remind_ts=? WHERE id=?",
             (ts, ticket_id)
         )
-        await db.commit()
+    ticket_scheduler.reminded(ticket_id, ts)
+    ticket_cache.update(ticket_id, last_admin_remind_ts=ts)
+    support_stats.reminded(1, ts)
+    _tickets_changed()
+
+@_timed
+async def mark_admin_reminded_many(ticket_ids: list[int], ts: int):
+    async with _write() as db:
+        await db.execute(
+            "UPDATE tickets SET last_admin_remind_ts=? WHERE id IN (SELECT value FROM json_each(?))",
+            (ts, json.dumps(ticket_ids))
+        )
+    for tid in ticket_ids:
+        ticket_scheduler.reminded(tid, ts)
+        ticket_cache.update(tid, last_admin_remind_ts=ts)
+    support_stats.reminded(len(ticket_ids), ts)
+    _tickets_changed()
+
+@_timed
+async def close_ticket(ticket_id: int, status: str = "closed", ts: Optional[int] = None) -> bool:
+    # Заявка не удаляется: остаётся со статусом и позже уходит в архив
+    if status not in CLOSED_STATUSES:
+        raise ValueError(f"unknown ticket status: {status}")
+    ts = ts or int(time.time())
+    async with _write() as db:
+        async with db.execute(
+            "UPDATE tickets SET status=?, closed_ts=? WHERE id=? AND status='open' RETURNING assigned_to",
+            (status, ts, ticket_id)
+        ) as cur:
+            row = await cur.fetchone()
+    _ticket_closed(ticket_id, row["assigned_to"] if row else None)
+    if row is not None:
+        support_stats.closed(status, ts)
+    return row is not None
+
+@_timed
+async def close_tickets(
+    status: str,
+    ids: Optional[list[int]] = None,
+    user_id: Optional[int] = None,
+    created_before_ts: Optional[int] = None,
+    ts: Optional[int] = None,
+    limit: int = BULK_MAX,
+) -> list[dict]:
+    # Массовое закрытие одним UPDATE: условия складываются через AND,
+    # нужно хотя бы одно. Возвращает закрытые заявки (уже закрытые не попадают).
+    if status not in CLOSED_STATUSES:
+        raise ValueError(f"unknown ticket status: {status}")
+    if ids is None and user_id is None and created_before_ts is None:
+        raise ValueError("close_tickets needs ids, user_id or created_before_ts")
+    ts = ts or int(time.time())
+    async with _write() as db:
+        rows = await db.execute_fetchall(
+            """UPDATE tickets SET status=?1, closed_ts=?2 WHERE id IN (
+                   SELECT id FROM tickets
+                   WHERE status='open'
+                     AND (?3 IS NULL OR id IN (SELECT value FROM json_each(?3)))
+                     AND (?4 IS NULL OR user_id=?4)
+                     AND (?5 IS NULL OR created_ts<=?5)
+                   ORDER BY id LIMIT ?6
+               )
+               RETURNING id, user_id, assigned_to""",
+            (status, ts, json.dumps(ids) if ids is not None else None, user_id, created_before_ts, limit)
+        )
+    closed = sorted((dict(r) for r in rows), key=lambda r: r["id"])
+    for r in closed:
+        _ticket_closed(r["id"], r["assigned_to"])
+    if closed:
+        support_stats.closed(status, ts, len(closed))
+    return closed
+
+@_timed
+async def expire_tickets(cutoff_ts: int, limit: int = SWEEP_CHUNK) -> list[dict]:
+    # Одна транзакция на пачку; RETURNING отдаёт поля для уведомлений
+    now = int(time.time())
+    async with _write() as db:
+        rows = await db.execute_fetchall(
+            """UPDATE tickets SET status='expired', closed_ts=?1 WHERE id IN (
+                   SELECT id FROM tickets WHERE status='open' AND created_ts<=?2
+                   ORDER BY created_ts LIMIT ?3
+               )
+               RETURNING id, user_id, assigned_to""",
+            (now, cutoff_ts, limit)
+        )
+    expired = [dict(r) for r in rows]
+    for r in expired:
+        _ticket_closed(r["id"], r["assigned_to"])
+    if expired:
+        support_stats.closed("expired", now, len(expired))
+    return expired
+
+@_timed
+async def reassign_ticket(ticket_id: int, operator_id: int) -> bool:
+    async with _write() as db:
+        async with db.execute(
+            "SELECT assigned_to FROM tickets WHERE id=? AND status='open'",
+            (ticket_id,)
+        ) as cur:
+            row = await cur.fetchone()
+        if row is None:
+            return False
+        await db.execute("UPDATE tickets SET assigned_to=? WHERE id=?", (operator_id, ticket_id))
+    operator_pool.released(row["assigned_to"])
+    operator_pool.assigned(operator_id)
+    ticket_cache.update(ticket_id, assigned_to=operator_id)
+    _tickets_changed()
+    return True
+
+@_timed
+async def list_open_tickets_of(operator_id: int) -> list[dict]:
+    rows = await _fetchall(
+        "SELECT * FROM tickets WHERE assigned_to=? AND status='open' ORDER BY id",
+        (operator_id,)
+    )
+    return [dict(r) for r in rows]
+
+
+# ---------- operators ----------
+
+@_timed
+async def list_operators() -> list[dict]:
+    return [dict(r) for r in await _fetchall("SELECT * FROM operators ORDER BY user_id")]
+
+@_timed
+async def count_open_by_operator() -> dict[int, int]:
+    rows = await _fetchall(
+        "SELECT assigned_to, COUNT(*) AS cnt FROM tickets WHERE status='open' GROUP BY assigned_to"
+    )
+    return {r["assigned_to"]: r["cnt"] for r in rows}
+
+@_timed
+async def add_operator(user_id: int, ts: int) -> bool:
+    async with _write() as db:
+        cur = await db.execute(
+            "INSERT OR IGNORE INTO operators (user_id, on_duty, added_ts) VALUES (?, 1, ?)",
+            (user_id, ts)
+        )
+        added = cur.rowcount > 0
+    operator_pool.add(user_id)
+    return added
+
+@_timed
+async def remove_operator(user_id: int) -> bool:
+    async with _write() as db:
+        cur = await db.execute("DELETE FROM operators WHERE user_id=?", (user_id,))
+        removed = cur.rowcount > 0
+    operator_pool.remove(user_id)
+    return removed
+
+@_timed
+async def set_operator_duty(user_id: int, on_duty: bool) -> bool:
+    async with _write() as db:
+        cur = await db.execute(
+            "UPDATE operators SET on_duty=? WHERE user_id=?",
+            (int(on_duty), user_id)
+        )
+        updated = cur.rowcount > 0
+    operator_pool.set_duty(user_id, on_duty)
+    return updated
+
+
+# ---------- admin messages ----------
+
+@_timed
+async def link_admin_message(chat_id: int, message_id: int, ticket_id: int):
+    # Связь пишется только для заявки в tickets: при переносе в архив её подчистит триггер
+    async with _write() as db:
+        cur = await db.execute(
+            """INSERT OR REPLACE INTO admin_messages (chat_id, message_id, ticket_id)
+               SELECT ?, ?, id FROM tickets WHERE id=?""",
+            (chat_id, message_id, ticket_id)
+        )
+        linked = cur.rowcount > 0
+    if linked:
+        ADMIN_MSG_TO_TICKET.put((chat_id, message_id), ticket_id)
+
+@_timed
+async def get_ticket_id_by_admin_message(chat_id: int, message_id: int) -> Optional[int]:
+    tid = ADMIN_MSG_TO_TICKET.get((chat_id, message_id))
+    if tid is not None:
+        return tid
+
+    row = await _fetchone(
+        "SELECT ticket_id FROM admin_messages WHERE chat_id=? AND message_id=?",
+        (chat_id, message_id)
+    )
+    if row is None:
+        return None
+    ADMIN_MSG_TO_TICKET.put((chat_id, message_id), row["ticket_id"])
+    return row["ticket_id"]
+
+
+# ---------- archive ----------
+# Закрытые заявки живут в tickets ещё какое-то время (поиск, статус),
+# потом пачками переезжают в tickets_archive со сжатым текстом.
+
+def _pack(text: str) -> tuple[int, bytes]:
+    raw = text.encode("utf-8")
+    packed = zlib.compress(raw, ARCHIVE_ZLIB_LEVEL)
+    if len(packed) < len(raw):
+        return CODEC_ZLIB, packed
+    return CODEC_RAW, raw
+
+def _unpack(codec: int, blob: bytes) -> str:
+    if codec == CODEC_ZLIB:
+        blob = zlib.decompress(blob)
+    return blob.decode("utf-8")
+
+@_timed
+async def archive_tickets(closed_before_ts: int, limit: int = SWEEP_CHUNK) -> int:
+    # Одна пачка — одна транзакция; удаление из tickets чистит FTS и admin_messages триггерами.
+    # Возвращает число перенесённых заявок.
+    async with _write() as db:
+        rows = await db.execute_fetchall(
+            f"""SELECT {TICKET_COLUMNS} FROM tickets
+                WHERE status<>'open' AND closed_ts<=? ORDER BY closed_ts LIMIT ?""",
+            (closed_before_ts, limit)
+        )
+        if not rows:
+            return 0
+        archived = []
+        for r in rows:
+            codec, blob = _pack(r["message"])
+            values = list(r)
+            values[4] = blob
+            archived.append((*values, codec))
+        await db.executemany(
+            f"""INSERT INTO tickets_archive ({TICKET_COLUMNS}, codec)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)""",
+            archived
+        )
+        await db.execute(
+            "DELETE FROM tickets WHERE id IN (SELECT value FROM json_each(?))",
+            (json.dumps([r["id"] for r in rows]),)
+        )
+    return len(rows)
+
+@_timed
+async def purge_archive(closed_before_ts: int, limit: int = SWEEP_CHUNK) -> int:
+    # Срок хранения архива; возвращает число удалённых заявок
+    async with _write() as db:
+        rows = await db.execute_fetchall(
+            """DELETE FROM tickets_archive WHERE id IN (
+                   SELECT id FROM tickets_archive WHERE closed_ts<? ORDER BY closed_ts LIMIT ?
+               )
+               RETURNING id""",
+            (closed_before_ts, limit)
+        )
+        await db.execute(
+            "DELETE FROM attachments WHERE ticket_id IN (SELECT value FROM json_each(?))",
+            (json.dumps([r["id"] for r in rows]),)
+        )
+    for r in rows:
+        ticket_cache.forget(r["id"])
+    return len(rows)
+
+@_timed
+async def compact_db() -> int:
+    # Ограниченная порция обслуживания после переноса/удаления:
+    # слияние сегментов FTS (убирает метки удалённых строк) и возврат
+    # свободных страниц файлу, если база создана с auto_vacuum=INCREMENTAL.
+    # Возвращает число свободных страниц до сжатия.
+    async with _write() as db:
+        await db.execute("INSERT INTO tickets_fts (tickets_fts, rank) VALUES ('merge', ?)", (FTS_MERGE_PAGES,))
+        async with db.execute("PRAGMA freelist_count") as cur:
+            (free_pages,) = await cur.fetchone()
+        async with db.execute("PRAGMA auto_vacuum") as cur:
+            (auto_vacuum,) = await cur.fetchone()
+        if auto_vacuum == 2 and free_pages:
+            await db.execute_fetchall(f"PRAGMA incremental_vacuum({VACUUM_PAGES})")
+    return int(free_pages)
+
+
+# ---------- search ----------
+
+def fts_query(text: str) -> str:
+    # Слова через AND; префиксным («дюп» найдёт «дюпы») делаем только последнее —
+    # префикс по частому слову заметно дороже точного термина.
+    # Кавычки убирают синтаксис FTS5 из пользовательского ввода.
+    words = re.findall(r"\w+", text.lower())
+    terms = [f'"{w}"' for w in words]
+    if terms:
+        terms[-1] += "*"
+    return " ".join(terms)
+
+@_timed
+async def search_tickets(
+    text: str,
+    user_id: Optional[int] = None,
+    status: Optional[str] = None,
+    limit: int = 10,
+    offset: int = 0,
+) -> list[dict]:
+    # Лучшие совпадения первыми (bm25); для пагинации просите limit + 1
+    query = fts_query(text)
+    if not query:
+        return []
+    rows = await _fetchall(
+        """SELECT t.*, snippet(tickets_fts, 0, '«', '»', '…', 10) AS snippet
+           FROM tickets_fts JOIN tickets t ON t.id = tickets_fts.rowid
+           WHERE tickets_fts MATCH ?1
+             AND (?2 IS NULL OR t.user_id = ?2)
+             AND (?3 IS NULL OR t.status = ?3)
+           ORDER BY tickets_fts.rank
+           LIMIT ?4 OFFSET ?5""",
+        (query, user_id, status, limit, offset)
+    )
+    return [dict(r) for r in rows]
+
+
+# ---------- leases ----------
 
-async def delete_ticket(ticket_id: int) -> bool:
-    async with aiosqlite.connect(DB_PATH) as db:
-        cur = await db.execute("DELETE FROM tickets WHERE id=?", (ticket_id,))
-        await db.commit()
+@_timed
+async def acquire_lease(name: str, holder: str, ttl_sec: float, now: float) -> bool:
+    # Берёт свободную или просроченную аренду либо продлевает свою
+    async with _write() as db:
+        cur = await db.execute(
+            """INSERT INTO leases (name, holder, expires_ts) VALUES (?, ?, ?)
+               ON CONFLICT(name) DO UPDATE SET holder=excluded.holder, expires_ts=excluded.expires_ts
+               WHERE leases.holder=excluded.holder OR leases.expires_ts<?""",
+            (name, holder, now + ttl_sec, now)
+        )
         return cur.rowcount > 0
+
+@_timed
+async def release_lease(name: str, holder: str):
+    async with _write() as db:
+        await db.execute("DELETE FROM leases WHERE name=? AND holder=?", (name, holder))
+
+@_timed
+async def get_lease(name: str) -> Optional[dict]:
+    row = await _fetchone("SELECT * FROM leases WHERE name=?", (name,))
+    return dict(row) if row else None
+
+
+# ---------- stats ----------
+
+@_timed
+async def save_stats_rollup(rows: list[tuple[int, str, int, int]], purge_before_ts: int):
+    # rows: (bucket_ts, metric, key, прирост); приросты разных процессов складываются
+    async with _write() as db:
+        await db.executemany(
+            """INSERT INTO stats_rollup (bucket_ts, metric, key, value) VALUES (?, ?, ?, ?)
+               ON CONFLICT(bucket_ts, metric, key) DO UPDATE SET value=value+excluded.value""",
+            rows
+        )
+        await db.execute("DELETE FROM stats_rollup WHERE bucket_ts<?", (purge_before_ts,))
+
+@_timed
+async def load_stats_rollup(since_ts: int) -> list[dict]:
+    rows = await _fetchall("SELECT * FROM stats_rollup WHERE bucket_ts>=?", (since_ts,))
+    return [dict(r) for r in rows]
+
+
+# ---------- meta ----------
+
+@_timed
+async def get_meta(key: str) -> Optional[str]:
+    row = await _fetchone("SELECT value FROM meta WHERE key=?", (key,))
+    return row["value"] if row else None
+
+@_timed
+async def set_meta(key: str, value: Optional[str]):
+    async with _write() as db:
+        if value is None:
+            await db.execute("DELETE FROM meta WHERE key=?", (key,))
+        else:
+            await db.execute(
+                "INSERT INTO meta (key, value) VALUES (?, ?) ON CONFLICT(key) DO UPDATE SET value=excluded.value",
+                (key, value)
+            )
+
+
+# ---------- fsm ----------
+
+@_timed
+async def load_fsm_states(since_ts: int) -> list[dict]:
+    rows = await _fetchall("SELECT * FROM fsm_state WHERE updated_ts>=?", (since_ts,))
+    return [{**dict(r), "data": json.loads(r["data"])} for r in rows]
+
+@_timed
+async def save_fsm_states(upserts: list[tuple], deletes: list[tuple]):
+    # upserts: (bot_id, chat_id, user_id, thread_id, destiny, state, data, updated_ts)
+    # deletes: (bot_id, chat_id, user_id, thread_id, destiny)
+    async with _write() as db:
+        await db.executemany(
+            """INSERT INTO fsm_state (bot_id, chat_id, user_id, thread_id, destiny, state, data, updated_ts)
+               VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+               ON CONFLICT(bot_id, chat_id, user_id, thread_id, destiny) DO UPDATE SET
+                   state=excluded.state, data=excluded.data, updated_ts=excluded.updated_ts""",
+            [(*row[:6], json.dumps(row[6], ensure_ascii=False), row[7]) for row in upserts]
+        )
+        await db.executemany(
+            """DELETE FROM fsm_state
+               WHERE bot_id=? AND chat_id=? AND user_id=? AND thread_id=? AND destiny=?""",
+            deletes
+        )
+
+@_timed
+async def purge_fsm_states(before_ts: int):
+    async with _write() as db:
+        await db.execute("DELETE FROM fsm_state WHERE updated_ts<?", (before_ts,))
@@ -0,0 +1,143 @@
+import asyncio
+import contextlib
+import logging
+import time
+from dataclasses import dataclass, field
+from typing import Any, Dict, Optional
+
+from aiogram.fsm.state import State
+from aiogram.fsm.storage.base import BaseStorage, StateType, StorageKey
+
+try:
+    from .db import load_fsm_states, save_fsm_states, purge_fsm_states
+except ImportError:
+    from db import load_fsm_states, save_fsm_states, purge_fsm_states
+
+logger = logging.getLogger(__name__)
+
+# Брошенные сценарии (начал заявку и ушёл) забываем через сутки
+FSM_TTL_SEC = 24 * 60 * 60
+FLUSH_INTERVAL_SEC = 1
+PURGE_EVERY_SEC = 10 * 60
+
+
+@dataclass
+class _Record:
+    state: Optional[str] = None
+    data: Dict[str, Any] = field(default_factory=dict)
+    touched_ts: float = 0.0
+
+
+def _row_key(key: StorageKey) -> tuple:
+    return key.bot_id, key.chat_id, key.user_id, key.thread_id or 0, key.destiny
+
+
+class SQLiteStorage(BaseStorage):
+    # FSM-хранилище в bot.db. Все живые состояния держим в памяти, поэтому
+    # чтение не ходит в БД; изменения пишутся в кэш сразу, а в таблицу
+    # fsm_state — пачкой раз в FLUSH_INTERVAL_SEC через общий writer.
+
+    def __init__(self, ttl_sec: int = FSM_TTL_SEC):
+        self._ttl_sec = ttl_sec
+        self._records: dict[StorageKey, _Record] = {}
+        self._dirty: set[StorageKey] = set()
+        self._flusher: Optional[asyncio.Task] = None
+        self._last_purge = 0.0
+
+    def __len__(self) -> int:
+        return len(self._records)
+
+    async def load(self):
+        now = time.time()
+        self._records.clear()
+        for row in await load_fsm_states(int(now - self._ttl_sec)):
+            key = StorageKey(
+                bot_id=row["bot_id"],
+                chat_id=row["chat_id"],
+                user_id=row["user_id"],
+                thread_id=row["thread_id"] or None,
+                destiny=row["destiny"],
+            )
+            self._records[key] = _Record(state=row["state"], data=row["data"], touched_ts=now)
+
+    def start(self):
+        self._flusher = asyncio.create_task(self._run_flusher())
+
+    async def set_state(self, key: StorageKey, state: StateType = None) -> None:
+        record = self._touch(key)
+        record.state = state.state if isinstance(state, State) else state
+        self._changed(key, record)
+
+    async def get_state(self, key: StorageKey) -> Optional[str]:
+        record = self._records.get(key)
+        return record.state if record else None
+
+    async def set_data(self, key: StorageKey, data: Dict[str, Any]) -> None:
+        record = self._touch(key)
+        record.data = data.copy()
+        self._changed(key, record)
+
+    async def get_data(self, key: StorageKey) -> Dict[str, Any]:
+        record = self._records.get(key)
+        return record.data.copy() if record else {}
+
+    async def close(self) -> None:
+        if self._flusher is not None:
+            self._flusher.cancel()
+            with contextlib.suppress(asyncio.CancelledError):
+                await self._flusher
+            self._flusher = None
+        await self.flush()
+
+    def _touch(self, key: StorageKey) -> _Record:
+        record = self._records.get(key)
+        if record is None:
+            record = self._records[key] = _Record()
+        record.touched_ts = time.time()
+        return record
+
+    def _changed(self, key: StorageKey, record: _Record):
+        # пустая запись не хранится ни в памяти, ни в БД
+        if record.state is None and not record.data:
+            del self._records[key]
+        self._dirty.add(key)
+
+    async def flush(self):
+        if not self._dirty:
+            return
+        dirty, self._dirty = self._dirty, set()
+
+        upserts, deletes = [], []
+        for key in dirty:
+            record = self._records.get(key)
+            if record is None:
+                deletes.append(_row_key(key))
+            else:
+                upserts.append((*_row_key(key), record.state, record.data, int(record.touched_ts)))
+
+        try:
+            await save_fsm_states(upserts, deletes)
+        except Exception:
+            self._dirty |= dirty
+            raise
+
+    def _expire(self, now: float):
+        cutoff = now - self._ttl_sec
+        stale = [key for key, record in self._records.items() if record.touched_ts < cutoff]
+        for key in stale:
+            del self._records[key]
+            self._dirty.discard(key)
+
+    async def _run_flusher(self):
+        while True:
+            await asyncio.sleep(FLUSH_INTERVAL_SEC)
+            try:
+                await self.flush()
+
+                now = time.time()
+                if now - self._last_purge >= PURGE_EVERY_SEC:
+                    self._last_purge = now
+                    self._expire(now)
+                    await purge_fsm_states(int(now - self._ttl_sec))
+            except Exception:
+                logger.exception("event=fsm_flush_error dirty=%d", len(self._dirty))
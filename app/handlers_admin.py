@@ -1,29 +1,68 @@
 from aiogram import Router, F
+from aiogram.filters import Command, CommandObject
 from aiogram.types import Message, CallbackQuery
+from collections import OrderedDict
+from typing import Optional
+import asyncio
+import itertools
 import time
 
 # FIX: двойные импорты
 try:
-    from .support_bridge import ADMIN_MSG_TO_TICKET
-    from .db import get_ticket, delete_ticket, mark_admin_replied
+    from .db import (
+        get_ticket, get_ticket_id_by_admin_message, close_tickets, mark_admin_replied, BULK_MAX,
+        add_operator, remove_operator, set_operator_duty, list_open_tickets_of, search_tickets
+    )
+    from .keyboards import search_results_kb
+    from .operators import operator_pool
+    from .outbox import outbox, PRIORITY_REPLY, PRIORITY_NOTIFY
+    from .routing import hand_over
+    from .board import queue_board
+    from .stats import support_stats, STATS_WINDOW_HOURS
 except ImportError:
-    from support_bridge import ADMIN_MSG_TO_TICKET
-    from db import get_ticket, delete_ticket, mark_admin_replied
+    from db import (
+        get_ticket, get_ticket_id_by_admin_message, close_tickets, mark_admin_replied, BULK_MAX,
+        add_operator, remove_operator, set_operator_duty, list_open_tickets_of, search_tickets
+    )
+    from keyboards import search_results_kb
+    from operators import operator_pool
+    from outbox import outbox, PRIORITY_REPLY, PRIORITY_NOTIFY
+    from routing import hand_over
+    from board import queue_board
+    from stats import support_stats, STATS_WINDOW_HOURS
 
 admin_router = Router()
 
+SEARCH_TITLE = "🔎 Поиск"
+SEARCH_PAGE_SIZE = 5
+# Параметры поиска для кнопок «Дальше/Назад» (в callback_data всего 64 байта)
+MAX_SAVED_SEARCHES = 500
+SEARCH_STATUSES = {"open", "closed", "deleted", "expired"}
+
+# Массовые /close и /delete: сколько уведомлений игрокам держим в очереди outbox
+# одновременно, чтобы не оттеснять остальные отправки
+BULK_NOTIFY_CONCURRENCY = 20
+
+_searches: OrderedDict[int, tuple[str, Optional[int], Optional[str]]] = OrderedDict()
+_search_ids = itertools.count(1)
+
 
 def is_admin(user_id: int, config) -> bool:
+    # главный админ из settings.py или любой оператор из пула
+    return user_id == config["admin_id"] or operator_pool.is_operator(user_id)
+
+
+def is_superadmin(user_id: int, config) -> bool:
     return user_id == config["admin_id"]
 
 
 @admin_router.message(F.reply_to_message)
-async def admin_reply_via_reply(message: Message, bot, config):
+async def admin_reply_via_reply(message: Message, config):
     if not is_admin(message.from_user.id, config):
         return
 
     replied = message.reply_to_message
-    tid = ADMIN_MSG_TO_TICKET.get(replied.message_id)
+    tid = await get_ticket_id_by_admin_message(message.chat.id, replied.message_id)
     if not tid:
         return
 
@@ -31,19 +70,26 @@ async def admin_reply_via_reply(message: Message, bot, config):
     if not ticket:
         await message.answer("❌ Заявка уже удалена/очищена.")
         return
+    if ticket["status"] != "open":
+        await message.answer(f"❌ Заявка #{tid} уже закрыта — ответ не отправлен.")
+        return
 
     text = (message.text or message.caption or "").strip()
     if not text:
         await message.answer("Напиши текст ответа сообщением 🙂")
         return
 
-    await bot.send_message(ticket["user_id"], f"✉️ Ответ по заявке #{tid}:\n\n{text}")
+    try:
+        await outbox.send_message(ticket["user_id"], f"✉️ Ответ по заявке #{tid}:\n\n{text}", priority=PRIORITY_REPLY)
+    except Exception as e:
+        await message.answer(f"❌ Не удалось отправить игроку: {e}")
+        return
     await mark_admin_replied(tid, int(time.time()))
     await message.answer(f"✅ Отправлено игроку (заявка #{tid}).")
 
 
 @admin_router.callback_query(F.data.startswith(("tclose:", "tdelete:")))
-async def admin_ticket_actions(c: CallbackQuery, bot, config):
+async def admin_ticket_actions(c: CallbackQuery, config):
     if not is_admin(c.from_user.id, config):
         await c.answer("Нет доступа", show_alert=True)
         return
@@ -51,22 +97,311 @@ async def admin_ticket_actions(c: CallbackQuery, bot, config):
     action, tid_str = c.data.split(":")
     tid = int(tid_str)
 
-    ticket = await get_ticket(tid)
-    ok = await delete_ticket(tid)
+    # один UPDATE ... RETURNING: отдельный get_ticket не нужен
+    closed = await close_tickets("closed" if action == "tclose" else "deleted", ids=[tid])
 
-    if not ok:
-        await c.answer("Уже удалено", show_alert=True)
+    if not closed:
+        await c.answer("Заявка уже закрыта", show_alert=True)
         return
 
-    if action == "tclose" and ticket:
-        try:
-            await bot.send_message(ticket["user_id"], f"✅ Ваша заявка #{tid} закрыта. Спасибо!")
-        except Exception as e:
-            print(f"[USER_SEND_ERROR] {e}")
+    if action == "tclose":
+        outbox.send_message(closed[0]["user_id"], f"✅ Ваша заявка #{tid} закрыта. Спасибо!", priority=PRIORITY_NOTIFY)
+
+    done = f"✅ Готово: заявка #{tid} {'закрыта' if action == 'tclose' else 'удалена'}."
+    is_list = (c.message.text or "").startswith(SEARCH_TITLE)
+    if is_list or queue_board.is_board_message(c.message.chat.id, c.message.message_id):
+        # списки не затираем: доска перерисуется сама после close_tickets
+        await c.answer(done)
+        return
 
     try:
-        await c.message.edit_text(f"✅ Готово: заявка #{tid} {'закрыта' if action == 'tclose' else 'удалена'}.")
+        await c.message.edit_text(done)
     except Exception:
         pass
 
     await c.answer()
+
+
+# ---------- bulk ----------
+
+BULK_USAGE = (
+    "Массовые действия с открытыми заявками:\n"
+    "/close 12 15 20-40 — по номерам и диапазонам\n"
+    "/close user:123456 — все заявки игрока\n"
+    "/close older:30 — открытые дольше 30 минут\n"
+    "Условия можно сочетать. /delete — то же без уведомления игрокам."
+)
+
+
+def parse_bulk_args(raw: str) -> Optional[tuple[Optional[list[int]], Optional[int], Optional[int]]]:
+    # "12 20-40 user:123 older:30" -> ([12, 20, ..., 40], 123, 30); None — ошибка в аргументах
+    ids: Optional[list[int]] = None
+    user_id = older_min = None
+    for token in raw.replace(",", " ").split():
+        key, _, value = token.partition(":")
+        if key == "user" and value.isdigit():
+            user_id = int(value)
+        elif key == "older" and value.isdigit():
+            older_min = int(value)
+        elif not value:
+            first, _, last = token.lstrip("#").partition("-")
+            if not first.isdigit() or (last and not last.isdigit()):
+                return None
+            start, end = int(first), int(last or first)
+            if end < start or end - start >= BULK_MAX:
+                return None
+            ids = (ids or []) + list(range(start, end + 1))
+        else:
+            return None
+    if ids is None and user_id is None and older_min is None:
+        return None
+    if ids is not None and len(ids) > BULK_MAX:
+        return None
+    return ids, user_id, older_min
+
+
+async def notify_closed(tickets: list[dict]) -> tuple[int, int]:
+    # Одно уведомление на игрока, не больше BULK_NOTIFY_CONCURRENCY в очереди сразу.
+    # Возвращает (доставлено, не доставлено).
+    by_user: dict[int, list[int]] = {}
+    for t in tickets:
+        by_user.setdefault(t["user_id"], []).append(t["id"])
+    limit = asyncio.Semaphore(BULK_NOTIFY_CONCURRENCY)
+
+    async def notify(user_id: int, ids: list[int]) -> bool:
+        numbers = ", ".join(f"#{tid}" for tid in ids)
+        text = f"✅ Ваша заявка {numbers} закрыта. Спасибо!" if len(ids) == 1 else f"✅ Ваши заявки {numbers} закрыты. Спасибо!"
+        async with limit:
+            try:
+                await outbox.send_message(user_id, text, priority=PRIORITY_NOTIFY)
+            except Exception:
+                return False
+        return True
+
+    results = await asyncio.gather(*(notify(user_id, ids) for user_id, ids in by_user.items()))
+    return sum(results), len(results) - sum(results)
+
+
+@admin_router.message(Command("close", "delete"))
+async def admin_bulk_close(message: Message, command: CommandObject, config):
+    if not is_admin(message.from_user.id, config):
+        return
+
+    parsed = parse_bulk_args(command.args or "")
+    if parsed is None:
+        await message.answer(BULK_USAGE)
+        return
+    ids, user_id, older_min = parsed
+    now = int(time.time())
+    closing = command.command == "close"
+
+    status = await message.answer("⏳ Закрываю…" if closing else "⏳ Удаляю…")
+    closed = await close_tickets(
+        "closed" if closing else "deleted",
+        ids=ids,
+        user_id=user_id,
+        created_before_ts=now - older_min * 60 if older_min is not None else None,
+        ts=now,
+    )
+
+    lines = [f"✅ {'Закрыто' if closing else 'Удалено'} заявок: {len(closed)}"]
+    if ids is not None and len(closed) < len(ids):
+        lines.append(f"Пропущено (нет такой или уже закрыта): {len(ids) - len(closed)}")
+    if len(closed) == BULK_MAX:
+        lines.append(f"Достигнут предел {BULK_MAX} за раз — повторите команду.")
+    if closed:
+        shown = ", ".join(f"#{t['id']}" for t in closed[:50])
+        lines.append(shown + (f" и ещё {len(closed) - 50}" if len(closed) > 50 else ""))
+    if closing and closed:
+        sent, failed = await notify_closed(closed)
+        lines.append(f"Уведомлено игроков: {sent}" + (f", не доставлено: {failed}" if failed else ""))
+
+    try:
+        await status.edit_text("\n".join(lines))
+    except Exception:
+        await message.answer("\n".join(lines))
+
+
+# ---------- search ----------
+
+def parse_search_args(raw: str) -> tuple[str, Optional[int], Optional[str]]:
+    # "дюп алмазы user:123 status:open" -> ("дюп алмазы", 123, "open")
+    words, user_id, status = [], None, None
+    for token in raw.split():
+        key, _, value = token.partition(":")
+        if key == "user" and value.isdigit():
+            user_id = int(value)
+        elif key == "status" and value in SEARCH_STATUSES:
+            status = value
+        else:
+            words.append(token)
+    return " ".join(words), user_id, status
+
+
+async def render_search(search_id: int, offset: int) -> tuple[str, object]:
+    text, user_id, status = _searches[search_id]
+    hits = await search_tickets(text, user_id, status, limit=SEARCH_PAGE_SIZE + 1, offset=offset)
+    has_next = len(hits) > SEARCH_PAGE_SIZE
+    hits = hits[:SEARCH_PAGE_SIZE]
+
+    filters = "".join([f" · user {user_id}" if user_id else "", f" · {status}" if status else ""])
+    lines = [f"{SEARCH_TITLE}: «{text}»{filters}"]
+    if not hits:
+        lines.append("\nНичего не найдено." if not offset else "\nБольше результатов нет.")
+    for t in hits:
+        uname = f"@{t['username']}" if t["username"] else ""
+        mark = "🟢" if t["status"] == "open" else "⚫️"
+        lines.append(f"\n{mark} #{t['id']} · {t['user_id']} {uname} · {t['created_at']}\n{t['snippet']}")
+    if hits:
+        lines.append(f"\nРезультаты {offset + 1}–{offset + len(hits)}")
+
+    markup = search_results_kb([t["id"] for t in hits], search_id, offset, SEARCH_PAGE_SIZE, has_next)
+    return "\n".join(lines), markup
+
+
+@admin_router.message(Command("find"))
+async def admin_search(message: Message, command: CommandObject, config):
+    if not is_admin(message.from_user.id, config):
+        return
+
+    text, user_id, status = parse_search_args(command.args or "")
+    if not text:
+        await message.answer("Пример: /find дюп алмазы user:123456 status:open")
+        return
+
+    search_id = next(_search_ids)
+    _searches[search_id] = (text, user_id, status)
+    while len(_searches) > MAX_SAVED_SEARCHES:
+        _searches.popitem(last=False)
+
+    body, markup = await render_search(search_id, 0)
+    await message.answer(body, reply_markup=markup)
+
+
+@admin_router.callback_query(F.data.startswith("fnd:"))
+async def admin_search_page(c: CallbackQuery, config):
+    if not is_admin(c.from_user.id, config):
+        await c.answer("Нет доступа", show_alert=True)
+        return
+
+    _, search_id, offset = c.data.split(":")
+    if int(search_id) not in _searches:
+        await c.answer("Поиск устарел — повторите /find", show_alert=True)
+        return
+
+    body, markup = await render_search(int(search_id), int(offset))
+    try:
+        await c.message.edit_text(body, reply_markup=markup)
+    except Exception:
+        pass
+    await c.answer()
+
+
+# ---------- stats ----------
+
+def _duration(seconds: Optional[float]) -> str:
+    if seconds is None:
+        return "—"
+    if seconds < 60:
+        return f"{round(seconds)} с"
+    if seconds < 3600:
+        return f"{round(seconds / 60)} мин"
+    return f"{int(seconds // 3600)} ч {round(seconds % 3600 / 60)} мин"
+
+
+def render_stats(snap: dict) -> str:
+    day, hour = snap["day"], snap["hour"]
+
+    def counts(c: dict) -> str:
+        return (
+            f"новых {c.get('opened', 0)} · ответов {c.get('replied', 0)} · "
+            f"закрыто {c.get('closed', 0)} · удалено {c.get('deleted', 0)} · "
+            f"автозакрыто {c.get('expired', 0)} · напоминаний {c.get('reminded', 0)}"
+        )
+
+    answered = day.get("first_reply", 0)
+    lines = [
+        "📊 Статистика поддержки",
+        f"Открыто сейчас: {snap['open']}",
+        "",
+        f"За {STATS_WINDOW_HOURS} ч: {counts(day)}",
+        f"За текущий час: {counts(hour)}",
+        f"Автозакрытий в час (среднее за {STATS_WINDOW_HOURS} ч): {day.get('expired', 0) / STATS_WINDOW_HOURS:.1f}",
+        "",
+        f"Первый ответ ({answered} заявок): медиана {_duration(snap['first_reply_p50'])} · "
+        f"90% — до {_duration(snap['first_reply_p90'])}",
+    ]
+    if snap["top_users"]:
+        top = ", ".join(f"{user_id} ({n})" for user_id, n in snap["top_users"])
+        lines.append(f"Чаще всего пишут: {top}")
+    return "\n".join(lines)
+
+
+@admin_router.message(Command("stats"))
+async def admin_stats(message: Message, config):
+    if not is_admin(message.from_user.id, config):
+        return
+    # только память процесса: никаких запросов к tickets
+    await message.answer(render_stats(support_stats.snapshot(int(time.time()))))
+
+
+# ---------- operators ----------
+
+@admin_router.message(Command("ops"))
+async def operators_list(message: Message, config):
+    if not is_admin(message.from_user.id, config):
+        return
+
+    lines = ["👥 Операторы:"]
+    for op_id, on_duty, queue in operator_pool.snapshot():
+        mark = "🟢" if on_duty else "⚪️"
+        lines.append(f"{mark} {op_id} — открытых заявок: {queue}")
+    await message.answer("\n".join(lines))
+
+
+@admin_router.message(Command("op_add", "op_del"))
+async def operators_manage(message: Message, command: CommandObject, config):
+    if not is_superadmin(message.from_user.id, config):
+        return
+
+    raw = (command.args or "").strip()
+    if not raw.isdigit():
+        await message.answer(f"Нужен ID. Пример: `/{command.command} 123456789`", parse_mode="Markdown")
+        return
+    op_id = int(raw)
+
+    if command.command == "op_add":
+        added = await add_operator(op_id, int(time.time()))
+        await message.answer(f"✅ Оператор {op_id} добавлен." if added else "Уже в списке.")
+        return
+
+    if op_id == config["admin_id"]:
+        await message.answer("Главного админа убрать нельзя.")
+        return
+    if not await remove_operator(op_id):
+        await message.answer("Такого оператора нет.")
+        return
+    moved = await hand_over(await list_open_tickets_of(op_id))
+    await message.answer(f"✅ Оператор {op_id} удалён. Передано заявок: {moved}.")
+
+
+@admin_router.message(Command("duty"))
+async def operator_duty(message: Message, config):
+    op_id = message.from_user.id
+    if not operator_pool.is_operator(op_id):
+        return
+
+    on_duty = not operator_pool.is_on_duty(op_id)
+    await set_operator_duty(op_id, on_duty)
+    if on_duty:
+        await message.answer("🟢 Ты на смене — новые заявки будут приходить тебе.")
+        return
+
+    await message.answer("⚪️ Смена завершена. Передаю открытые заявки…")
+    tickets = await list_open_tickets_of(op_id)
+    moved = await hand_over(tickets)
+    left = len(tickets) - moved
+    await message.answer(
+        f"Передано заявок: {moved}."
+        + (f" Осталось у тебя: {left} (на смене больше никого нет)." if left else "")
+    )
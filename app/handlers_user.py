@@ -7,23 +7,21 @@ import time
 
 # FIX: двойные импорты (для запуска файлом и модулем)
 try:
-    from .keyboards import main_menu, back_menu, admin_ticket_kb
-    from .support_bridge import ADMIN_MSG_TO_TICKET
+    from .keyboards import main_menu, back_menu
+    from .outbox import outbox
+    from .routing import pick_operator, send_ticket_card
+    from .ratelimit import rate_limiter, Rule, TICKET, CALL, COOLDOWN
     from . import texts
-    from .db import (
-        create_ticket, get_ticket,
-        get_user_limits, set_last_ticket_ts, set_last_call_ts,
-        count_tickets_in_window
-    )
+    from .db import submit_ticket, get_ticket
+    from .attachments import album_collector, extract_attachment
 except ImportError:
-    from keyboards import main_menu, back_menu, admin_ticket_kb
-    from support_bridge import ADMIN_MSG_TO_TICKET
+    from keyboards import main_menu, back_menu
+    from outbox import outbox
+    from routing import pick_operator, send_ticket_card
+    from ratelimit import rate_limiter, Rule, TICKET, CALL, COOLDOWN
     import texts
-    from db import (
-        create_ticket, get_ticket,
-        get_user_limits, set_last_ticket_ts, set_last_call_ts,
-        count_tickets_in_window
-    )
+    from db import submit_ticket, get_ticket
+    from attachments import album_collector, extract_attachment
 
 user_router = Router()
 
@@ -32,6 +30,16 @@ TICKET_WINDOW_SEC = 600
 TICKET_MAX_PER_WINDOW = 3
 CALL_COOLDOWN_SEC = 60
 
+STATUS_LABELS = {
+    "open": "🟢 Открыта",
+    "closed": "⚫️ Закрыта",
+    "deleted": "⚫️ Закрыта",
+    "expired": "⌛️ Закрыта автоматически",
+}
+
+rate_limiter.configure(TICKET, Rule(TICKET_COOLDOWN_SEC, TICKET_WINDOW_SEC, TICKET_MAX_PER_WINDOW))
+rate_limiter.configure(CALL, Rule(CALL_COOLDOWN_SEC))
+
 
 class TicketFlow(StatesGroup):
     waiting_text = State()
@@ -61,37 +69,58 @@ async def ticket_start(message: Message, state: FSMContext):
 
 
 @user_router.message(TicketFlow.waiting_text)
-async def ticket_text(message: Message, state: FSMContext, bot, config):
-    content = (message.text or message.caption or "").strip()
-    if not content:
+async def ticket_text(message: Message, state: FSMContext, config):
+    parts = [message]
+    if message.media_group_id:
+        # альбом приходит отдельными апдейтами; заявку создаёт первая часть, получив все
+        parts = await album_collector.collect(message)
+        if parts is None:
+            return
+
+    content = "\n".join(m.text or m.caption for m in parts if m.text or m.caption).strip()
+    attachments = [a for a in map(extract_attachment, parts) if a]
+    if not content and not attachments:
         await message.answer("Напиши текстом, что случилось 🙂", reply_markup=back_menu())
         return
 
     now = int(time.time())
 
-    limits = await get_user_limits(message.from_user.id)
-    if now - int(limits["last_ticket_ts"]) < TICKET_COOLDOWN_SEC:
-        wait = TICKET_COOLDOWN_SEC - (now - int(limits["last_ticket_ts"]))
+    reason, wait = rate_limiter.try_acquire(message.from_user.id, TICKET, now)
+    if not reason:
+        created_at = datetime.now(timezone.utc).strftime("%Y-%m-%d %H:%M UTC")
+        operator_id = pick_operator(config["admin_id"])
+        # лимиты перепроверяются в той же транзакции, что и создание заявки;
+        # если заявка не создана, отметку в лимитере снимаем
+        try:
+            result = await submit_ticket(
+                user_id=message.from_user.id,
+                username=message.from_user.username,
+                message=content,
+                created_ts=now,
+                created_at=created_at,
+                cooldown_sec=TICKET_COOLDOWN_SEC,
+                window_sec=TICKET_WINDOW_SEC,
+                max_per_window=TICKET_MAX_PER_WINDOW,
+                assigned_to=operator_id,
+                attachments=attachments
+            )
+        except BaseException:
+            rate_limiter.release(message.from_user.id, TICKET, now)
+            raise
+        reason, wait = result["reason"], result["wait"]
+        if reason:
+            rate_limiter.release(message.from_user.id, TICKET, now)
+
+    if reason == COOLDOWN:
         await message.answer(f"⏳ Подожди {wait} сек и попробуй снова.", reply_markup=main_menu())
         await state.clear()
         return
-
-    cnt = await count_tickets_in_window(message.from_user.id, now - TICKET_WINDOW_SEC)
-    if cnt >= TICKET_MAX_PER_WINDOW:
+    if reason:
         await message.answer("🚫 Слишком много заявок за короткое время. Попробуй позже.", reply_markup=main_menu())
         await state.clear()
         return
 
-    created_at = datetime.now(timezone.utc).strftime("%Y-%m-%d %H:%M UTC")
-
-    ticket_id = await create_ticket(
-        user_id=message.from_user.id,
-        username=message.from_user.username,
-        message=content,
-        created_ts=now,
-        created_at=created_at
-    )
-    await set_last_ticket_ts(message.from_user.id, now)
+    ticket_id = result["ticket_id"]
 
     await state.clear()
     await message.answer(
@@ -100,34 +129,25 @@ async def ticket_text(message: Message, state: FSMContext, bot, config):
         reply_markup=main_menu()
     )
 
-    uname = f"@{message.from_user.username}" if message.from_user.username else "(без username)"
-    admin_text = (
-        f"🆕 Новая заявка #{ticket_id}\n"
-        f"От: {message.from_user.id} {uname}\n"
-        f"Дата: {created_at}\n\n"
-        f"{content}\n\n"
-        f"💡 Ответьте на это сообщение (Reply) — бот отправит ответ игроку."
-    )
-
-    try:
-        sent = await bot.send_message(config["admin_id"], admin_text, reply_markup=admin_ticket_kb(ticket_id))
-        ADMIN_MSG_TO_TICKET[sent.message_id] = ticket_id
-    except Exception as e:
-        print(f"[ADMIN_SEND_ERROR] {e}")
+    ticket = {
+        "id": ticket_id,
+        "user_id": message.from_user.id,
+        "username": message.from_user.username,
+        "created_at": created_at,
+        "message": content,
+    }
+    await send_ticket_card(ticket, operator_id, attachments=attachments)
 
 
 @user_router.message(F.text == "👤 Позвать оператора")
-async def call_operator(message: Message, bot, config):
+async def call_operator(message: Message, config):
     now = int(time.time())
-    limits = await get_user_limits(message.from_user.id)
 
-    if now - int(limits["last_call_ts"]) < CALL_COOLDOWN_SEC:
-        wait = CALL_COOLDOWN_SEC - (now - int(limits["last_call_ts"]))
+    reason, wait = rate_limiter.try_acquire(message.from_user.id, CALL, now)
+    if reason:
         await message.answer(f"⏳ Подожди {wait} сек и попробуй снова.", reply_markup=main_menu())
         return
 
-    await set_last_call_ts(message.from_user.id, now)
-
     await message.answer(texts.OPERATOR_CALLED, reply_markup=main_menu())
 
     uname = f"@{message.from_user.username}" if message.from_user.username else "(без username)"
@@ -137,10 +157,7 @@ async def call_operator(message: Message, bot, config):
         f"Username: {uname}"
     )
 
-    try:
-        await bot.send_message(config["admin_id"], text)
-    except Exception as e:
-        print(f"[ADMIN_SEND_ERROR] {e}")
+    outbox.send_message(pick_operator(config["admin_id"]), text)
 
 
 @user_router.message(F.text == "📌 Статус заявки")
@@ -163,13 +180,13 @@ async def status_check(message: Message, state: FSMContext):
         await state.clear()
         return
 
-    status = "🟢 Открыта" if ticket["status"] == "open" else "⚫️ Закрыта"
+    status = STATUS_LABELS.get(ticket["status"], "⚫️ Закрыта")
     await message.answer(
         texts.STATUS_TEMPLATE.format(
             ticket_id=ticket["id"],
             status=status,
             created_at=ticket["created_at"],
-            message=ticket["message"]
+            message=ticket["message"] or "(без текста, только вложения)"
         ),
         parse_mode="Markdown",
         reply_markup=main_menu()
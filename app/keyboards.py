@@ -29,3 +29,26 @@ def admin_ticket_kb(ticket_id: int) -> InlineKeyboardMarkup:
             ]
         ]
     )
+
+def _ticket_action_rows(ticket_ids: list[int]) -> list[list[InlineKeyboardButton]]:
+    return [
+        [
+            InlineKeyboardButton(text=f"✅ #{tid}", callback_data=f"tclose:{tid}"),
+            InlineKeyboardButton(text=f"🧹 #{tid}", callback_data=f"tdelete:{tid}")
+        ]
+        for tid in ticket_ids
+    ]
+
+def queue_board_kb(ticket_ids: list[int]) -> InlineKeyboardMarkup:
+    return InlineKeyboardMarkup(inline_keyboard=_ticket_action_rows(ticket_ids))
+
+def search_results_kb(ticket_ids: list[int], search_id: int, offset: int, page_size: int, has_next: bool) -> InlineKeyboardMarkup:
+    rows = _ticket_action_rows(ticket_ids)
+    nav = []
+    if offset > 0:
+        nav.append(InlineKeyboardButton(text="◀️ Назад", callback_data=f"fnd:{search_id}:{max(0, offset - page_size)}"))
+    if has_next:
+        nav.append(InlineKeyboardButton(text="Дальше ▶️", callback_data=f"fnd:{search_id}:{offset + page_size}"))
+    if nav:
+        rows.append(nav)
+    return InlineKeyboardMarkup(inline_keyboard=rows)
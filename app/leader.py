@@ -0,0 +1,88 @@
+import asyncio
+import contextlib
+import logging
+import os
+import socket
+import time
+import uuid
+from typing import Awaitable, Callable, Optional
+
+try:
+    from .db import acquire_lease, release_lease
+except ImportError:
+    from db import acquire_lease, release_lease
+
+logger = logging.getLogger(__name__)
+
+# Ведущий продлевает аренду каждые LEASE_HEARTBEAT_SEC; если он умер,
+# резервный процесс перехватит её не позже чем через TTL + HEARTBEAT
+LEASE_TTL_SEC = 15
+LEASE_HEARTBEAT_SEC = 5
+SWEEPER_LEASE = "sweeper"
+
+
+def instance_id() -> str:
+    return f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+
+
+class LeaderElection:
+    # Несколько процессов на одном bot.db: работу «только для одного»
+    # (очистка, напоминания, доска) выполняет держатель аренды в таблице leases.
+
+    def __init__(
+        self,
+        name: str,
+        holder: Optional[str] = None,
+        ttl_sec: float = LEASE_TTL_SEC,
+        heartbeat_sec: float = LEASE_HEARTBEAT_SEC,
+    ):
+        self.name = name
+        self.holder = holder or instance_id()
+        self._ttl_sec = ttl_sec
+        self._heartbeat_sec = heartbeat_sec
+        self._valid_until = 0.0
+        self._duty: Optional[asyncio.Task] = None
+
+    @property
+    def is_leader(self) -> bool:
+        # Аренда считается своей с запасом в один heartbeat: если продление
+        # застряло, работу прекращаем раньше, чем её сможет взять другой
+        return time.time() < self._valid_until - self._heartbeat_sec
+
+    async def run(self, duty: Callable[[], Awaitable[None]]):
+        # duty() запускается при получении аренды и отменяется при её потере
+        try:
+            while True:
+                await self._tick(duty)
+                await asyncio.sleep(self._heartbeat_sec)
+        finally:
+            await self._step_down()
+            with contextlib.suppress(Exception):
+                await release_lease(self.name, self.holder)
+
+    async def _tick(self, duty: Callable[[], Awaitable[None]]):
+        now = time.time()
+        try:
+            acquired = await acquire_lease(self.name, self.holder, self._ttl_sec, now)
+        except Exception:
+            logger.exception("event=lease_error lease=%s holder=%s", self.name, self.holder)
+            acquired = False
+
+        if self._duty is not None and self._duty.done() and not self._duty.cancelled() and self._duty.exception():
+            logger.error("event=duty_crashed lease=%s error=%r", self.name, self._duty.exception())
+
+        if acquired:
+            self._valid_until = now + self._ttl_sec
+            if self._duty is None or self._duty.done():
+                logger.info("event=lease_acquired lease=%s holder=%s", self.name, self.holder)
+                self._duty = asyncio.create_task(duty())
+        elif self._duty is not None:
+            logger.warning("event=lease_lost lease=%s holder=%s", self.name, self.holder)
+            await self._step_down()
+
+    async def _step_down(self):
+        self._valid_until = 0.0
+        if self._duty is not None:
+            self._duty.cancel()
+            await asyncio.gather(self._duty, return_exceptions=True)
+            self._duty = None
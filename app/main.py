@@ -1,97 +1,346 @@
 import asyncio
+import logging
 import time
 import contextlib
+from typing import Optional
+from urllib.parse import urlparse
 
+from aiohttp import web
 from aiogram import Bot, Dispatcher
-from aiogram.fsm.storage.memory import MemoryStorage
+from aiogram.client.session.aiohttp import AiohttpSession
+from aiogram.client.telegram import TelegramAPIServer
+from aiogram.webhook.aiohttp_server import SimpleRequestHandler, setup_application
 
 # ✅ Работает и при запуске "python -m app.main", и при "python app/main.py"
 try:
-    from .settings import BOT_TOKEN, ADMIN_ID
-    from .db import init_db, list_open_tickets, delete_ticket, mark_admin_reminded
+    from .settings import (
+        BOT_TOKEN, ADMIN_ID,
+        WEBHOOK_URL, WEBHOOK_SECRET, WEBHOOK_LISTEN_HOST, WEBHOOK_LISTEN_PORT,
+        QUEUE_BOARD, METRICS_LISTEN_HOST, METRICS_LISTEN_PORT, BOT_API_SERVER,
+        ARCHIVE_AFTER_DAYS, ARCHIVE_RETENTION_DAYS
+    )
+    from .db import (
+        init_db, close_db, list_open_ticket_timers, get_open_tickets,
+        expire_tickets, mark_admin_reminded_many, SWEEP_CHUNK,
+        archive_tickets, purge_archive, compact_db, count_open_tickets,
+        save_stats_rollup, load_stats_rollup,
+        add_operator, list_operators, count_open_by_operator
+    )
+    from .scheduler import ticket_scheduler, EXPIRE, REMIND, TICKET_TTL_SEC
+    from .outbox import outbox, PRIORITY_REMIND
+    from .ratelimit import rate_limiter
+    from .stats import support_stats, bucket_of, STATS_BUCKET_SEC, STATS_WINDOW_HOURS, STATS_FLUSH_SEC, STATS_RETENTION_DAYS
+    from .fsm_storage import SQLiteStorage
+    from .operators import operator_pool
+    from .routing import hand_over
+    from .board import queue_board
+    from .admission import admission
+    from .leader import LeaderElection, SWEEPER_LEASE
+    from .metrics import (
+        instrument_router, start_metrics_server,
+        SWEEP_SECONDS, SWEEP_DUE, SWEEP_EXPIRED, ARCHIVE_SECONDS, ARCHIVE_TICKETS
+    )
     from .handlers_user import user_router
     from .handlers_admin import admin_router
 except ImportError:
-    from settings import BOT_TOKEN, ADMIN_ID
-    from db import init_db, list_open_tickets, delete_ticket, mark_admin_reminded
+    from settings import (
+        BOT_TOKEN, ADMIN_ID,
+        WEBHOOK_URL, WEBHOOK_SECRET, WEBHOOK_LISTEN_HOST, WEBHOOK_LISTEN_PORT,
+        QUEUE_BOARD, METRICS_LISTEN_HOST, METRICS_LISTEN_PORT, BOT_API_SERVER,
+        ARCHIVE_AFTER_DAYS, ARCHIVE_RETENTION_DAYS
+    )
+    from db import (
+        init_db, close_db, list_open_ticket_timers, get_open_tickets,
+        expire_tickets, mark_admin_reminded_many, SWEEP_CHUNK,
+        archive_tickets, purge_archive, compact_db, count_open_tickets,
+        save_stats_rollup, load_stats_rollup,
+        add_operator, list_operators, count_open_by_operator
+    )
+    from scheduler import ticket_scheduler, EXPIRE, REMIND, TICKET_TTL_SEC
+    from outbox import outbox, PRIORITY_REMIND
+    from ratelimit import rate_limiter
+    from stats import support_stats, bucket_of, STATS_BUCKET_SEC, STATS_WINDOW_HOURS, STATS_FLUSH_SEC, STATS_RETENTION_DAYS
+    from fsm_storage import SQLiteStorage
+    from operators import operator_pool
+    from routing import hand_over
+    from board import queue_board
+    from admission import admission
+    from leader import LeaderElection, SWEEPER_LEASE
+    from metrics import (
+        instrument_router, start_metrics_server,
+        SWEEP_SECONDS, SWEEP_DUE, SWEEP_EXPIRED, ARCHIVE_SECONDS, ARCHIVE_TICKETS
+    )
     from handlers_user import user_router
     from handlers_admin import admin_router
 
 
-# Настройки автоочистки и напоминаний
-TICKET_TTL_SEC = 30 * 60
-REMIND_AFTER_SEC = 5 * 60
-REMIND_EVERY_SEC = 10 * 60
-LOOP_INTERVAL_SEC = 60
+# Сколько ждать отправки очереди сообщений при остановке
+OUTBOX_DRAIN_SEC = 10
 
+# Как часто переносить закрытые заявки в архив и чистить его
+ARCHIVE_INTERVAL_SEC = 3600
+DAY_SEC = 86400
 
-async def cleanup_and_remind_loop(bot: Bot, admin_id: int):
+LOG_FORMAT = "%(asctime)s level=%(levelname)s logger=%(name)s %(message)s"
+
+logger = logging.getLogger(__name__)
+
+
+async def expire_due_tickets(admin_id: int, now: int):
+    # автозакрытие тикетов старше 30 минут, пачками по SWEEP_CHUNK
     while True:
+        expired = await expire_tickets(now - TICKET_TTL_SEC)
+        SWEEP_EXPIRED.inc(amount=len(expired))
+
+        for t in expired:
+            tid = t["id"]
+            recipient = t["assigned_to"] or admin_id
+            if not queue_board.covers(recipient):
+                outbox.send_message(recipient, f"🧹 Заявка #{tid} закрыта автоматически (прошло > 30 минут).", priority=PRIORITY_REMIND)
+            outbox.send_message(
+                t["user_id"],
+                f"🧹 Заявка #{tid} была автоматически закрыта (прошло > 30 минут). Если актуально — создай новую.",
+                priority=PRIORITY_REMIND
+            )
+
+        if len(expired) < SWEEP_CHUNK:
+            return
+
+
+async def remind_admin(admin_id: int, ticket_ids: list[int], now: int):
+    # напоминания назначенному оператору, если он не отвечал;
+    # заявки операторов, ушедших со смены, передаются другим
+    tickets = await get_open_tickets(ticket_ids)
+
+    found = {t["id"] for t in tickets}
+    for tid in ticket_ids:
+        if tid not in found:
+            ticket_scheduler.remove(tid)
+
+    reminded, stale = [], []
+    for t in tickets:
+        if t["last_admin_reply_ts"] is not None:
+            ticket_scheduler.replied(t["id"])
+            continue
+
+        assignee = t["assigned_to"]
+        if assignee is not None and not operator_pool.is_on_duty(assignee) and operator_pool.pick(exclude=assignee):
+            stale.append(t)
+            reminded.append(t["id"])
+            continue
+
+        reminded.append(t["id"])
+        if queue_board.covers(assignee or admin_id):
+            # доска сама покажет ⏰ после mark_admin_reminded_many
+            continue
+        outbox.send_message(
+            assignee or admin_id,
+            f"⏰ Напоминание: заявка #{t['id']} ждёт ответа.\n"
+            f"От: {t['user_id']}\n"
+            f"Создано: {t['created_at']}",
+            priority=PRIORITY_REMIND
+        )
+
+    if stale:
+        await hand_over(stale)
+    if reminded:
+        await mark_admin_reminded_many(reminded, now)
+
+
+async def cleanup_and_remind_loop(admin_id: int, election: Optional[LeaderElection] = None):
+    # Планировщик восстанавливается из БД (в том числе при перехвате аренды
+    # другим процессом), дальше его обновляют функции db.py
+    ticket_scheduler.load(await list_open_ticket_timers())
+
+    while True:
+        due = await ticket_scheduler.wait_due()
+        if election is not None and not election.is_leader:
+            # аренда под вопросом — не трогаем; события вернутся через RETRY_AFTER_SEC
+            continue
+
+        expire_ids = [tid for tid, kind in due if kind == EXPIRE]
+        remind_ids = [tid for tid, kind in due if kind == REMIND]
+        SWEEP_DUE.set(len(expire_ids), EXPIRE)
+        SWEEP_DUE.set(len(remind_ids), REMIND)
+
         try:
-            now = int(time.time())
-            tickets = await list_open_tickets(limit=200)
-
-            for t in tickets:
-                tid = t["id"]
-                age = now - int(t["created_ts"])
-
-                # автоочистка тикетов старше 30 минут
-                if age >= TICKET_TTL_SEC:
-                    await delete_ticket(tid)
-                    try:
-                        await bot.send_message(admin_id, f"🧹 Заявка #{tid} удалена (прошло > 30 минут).")
-                        await bot.send_message(
-                            t["user_id"],
-                            f"🧹 Заявка #{tid} была автоматически очищена (прошло > 30 минут). Если актуально — создай новую."
-                        )
-                    except Exception:
-                        pass
-                    continue
-
-                # напоминания админу, если он не отвечал
-                last_reply = t.get("last_admin_reply_ts")
-                last_remind = t.get("last_admin_remind_ts") or 0
-
-                if last_reply is not None:
-                    continue
-
-                if age >= REMIND_AFTER_SEC and (now - int(last_remind)) >= REMIND_EVERY_SEC:
-                    try:
-                        await bot.send_message(
-                            admin_id,
-                            f"⏰ Напоминание: заявка #{tid} ждёт ответа.\n"
-                            f"От: {t['user_id']}\n"
-                            f"Создано: {t['created_at']}"
-                        )
-                        await mark_admin_reminded(tid, now)
-                    except Exception:
-                        pass
-
-        except Exception as e:
-            print(f"[BACKGROUND_ERROR] {e}")
-
-        await asyncio.sleep(LOOP_INTERVAL_SEC)
+            with SWEEP_SECONDS.time():
+                now = int(time.time())
+
+                if expire_ids:
+                    await expire_due_tickets(admin_id, now)
+                    # всё, что не вернул UPDATE, уже закрыто раньше
+                    for tid in expire_ids:
+                        ticket_scheduler.remove(tid)
+
+                for i in range(0, len(remind_ids), SWEEP_CHUNK):
+                    await remind_admin(admin_id, remind_ids[i:i + SWEEP_CHUNK], now)
+
+        except Exception:
+            logger.exception("event=background_error expire=%d remind=%d", len(expire_ids), len(remind_ids))
+
+
+async def archive_closed_tickets(now: int) -> tuple[int, int]:
+    # Каждая пачка — своя короткая транзакция, между ними проходят обычные записи
+    moved = purged = 0
+    while True:
+        batch = await archive_tickets(now - ARCHIVE_AFTER_DAYS * DAY_SEC)
+        moved += batch
+        if batch < SWEEP_CHUNK:
+            break
+
+    while ARCHIVE_RETENTION_DAYS:
+        batch = await purge_archive(now - ARCHIVE_RETENTION_DAYS * DAY_SEC)
+        purged += batch
+        if batch < SWEEP_CHUNK:
+            break
+
+    ARCHIVE_TICKETS.inc("moved", amount=moved)
+    ARCHIVE_TICKETS.inc("purged", amount=purged)
+    return moved, purged
+
+
+async def archive_loop():
+    while True:
+        try:
+            with ARCHIVE_SECONDS.time():
+                moved, purged = await archive_closed_tickets(int(time.time()))
+                free_pages = await compact_db() if moved or purged else 0
+            if moved or purged:
+                logger.info("event=archive moved=%d purged=%d free_pages=%d", moved, purged, free_pages)
+        except Exception:
+            logger.exception("event=archive_error")
+        await asyncio.sleep(ARCHIVE_INTERVAL_SEC)
+
+
+async def flush_stats():
+    # Свои приросты — в stats_rollup, обратно — окно со вкладом всех процессов
+    now = int(time.time())
+    rows = support_stats.take_pending(now)
+    if rows:
+        try:
+            await save_stats_rollup(rows, now - STATS_RETENTION_DAYS * DAY_SEC)
+        except Exception:
+            support_stats.restore_pending(rows)
+            raise
+    since = bucket_of(now) - (STATS_WINDOW_HOURS - 1) * STATS_BUCKET_SEC
+    support_stats.refresh(await load_stats_rollup(since), await count_open_tickets())
+
+
+async def stats_loop():
+    while True:
+        await asyncio.sleep(STATS_FLUSH_SEC)
+        try:
+            await flush_stats()
+        except Exception:
+            logger.exception("event=stats_flush_error")
+
+
+async def leader_duties(admin_id: int, election: LeaderElection):
+    # Всё, что при нескольких процессах на одном bot.db должен делать только один
+    duties = [cleanup_and_remind_loop(admin_id, election), archive_loop()]
+    if queue_board.enabled:
+        duties.append(queue_board.run())
+    await asyncio.gather(*duties)
+
+
+async def run_polling(bot: Bot, dp: Dispatcher):
+    # getUpdates не работает, пока у бота зарегистрирован вебхук
+    await bot.delete_webhook()
+    await dp.start_polling(bot, close_bot_session=False)
+
+
+async def run_webhook(bot: Bot, dp: Dispatcher):
+    app = web.Application()
+    # Telegram получает 200 сразу, апдейт обрабатывается фоновой задачей
+    SimpleRequestHandler(
+        dispatcher=dp,
+        bot=bot,
+        handle_in_background=True,
+        secret_token=WEBHOOK_SECRET or None,
+    ).register(app, path=urlparse(WEBHOOK_URL).path or "/")
+    setup_application(app, dp, bot=bot)
+
+    runner = web.AppRunner(app)
+    await runner.setup()
+    await web.TCPSite(runner, WEBHOOK_LISTEN_HOST, WEBHOOK_LISTEN_PORT).start()
+
+    await bot.set_webhook(
+        WEBHOOK_URL,
+        secret_token=WEBHOOK_SECRET or None,
+        allowed_updates=dp.resolve_used_update_types(),
+    )
+
+    try:
+        await asyncio.Event().wait()
+    finally:
+        await runner.cleanup()
 
 
 async def main():
+    logging.basicConfig(level=logging.INFO, format=LOG_FORMAT)
+
     await init_db()
 
-    bot = Bot(token=BOT_TOKEN)
-    dp = Dispatcher(storage=MemoryStorage())
+    # Состояния диалогов (TicketFlow) переживают перезапуск
+    storage = SQLiteStorage()
+    await storage.load()
+    storage.start()
+
+    session = AiohttpSession(api=TelegramAPIServer.from_base(BOT_API_SERVER)) if BOT_API_SERVER else None
+    bot = Bot(token=BOT_TOKEN, session=session)
+    dp = Dispatcher(storage=storage)
 
     dp["config"] = {"admin_id": ADMIN_ID}
+    # очередь и лимиты на игрока, общий лимит и отсечение при перегрузке БД
+    dp.update.outer_middleware(admission)
+
+    # главный админ всегда есть в пуле операторов
+    await add_operator(ADMIN_ID, int(time.time()))
+    operator_pool.load(await list_operators(), await count_open_by_operator())
+
+    for router in (user_router, admin_router):
+        instrument_router(router)
+        dp.include_router(router)
+
+    await rate_limiter.load(int(time.time()))
+    await flush_stats()
 
-    dp.include_router(user_router)
-    dp.include_router(admin_router)
+    # /metrics только для локального Prometheus; порт 0 — выключено
+    metrics_runner = None
+    if METRICS_LISTEN_PORT:
+        metrics_runner = await start_metrics_server(METRICS_LISTEN_HOST, METRICS_LISTEN_PORT)
 
-    bg_task = asyncio.create_task(cleanup_and_remind_loop(bot, ADMIN_ID))
+    outbox.start(bot)
+    if QUEUE_BOARD:
+        await queue_board.start(ADMIN_ID)
+    election = LeaderElection(SWEEPER_LEASE)
+    bg_tasks = [
+        asyncio.create_task(election.run(lambda: leader_duties(ADMIN_ID, election))),
+        asyncio.create_task(rate_limiter.run_flusher()),
+        asyncio.create_task(stats_loop()),
+    ]
 
     try:
-        await dp.start_polling(bot)
+        if WEBHOOK_URL:
+            await run_webhook(bot, dp)
+        else:
+            await run_polling(bot, dp)
     finally:
-        bg_task.cancel()
-        with contextlib.suppress(asyncio.CancelledError):
-            await bg_task
+        for task in bg_tasks:
+            task.cancel()
+        for task in bg_tasks:
+            with contextlib.suppress(asyncio.CancelledError):
+                await task
+        await rate_limiter.flush()
+        with contextlib.suppress(Exception):
+            await flush_stats()
+        await storage.close()
+        await outbox.drain(OUTBOX_DRAIN_SEC)
+        await bot.session.close()
+        if metrics_runner is not None:
+            await metrics_runner.cleanup()
+        await close_db()
 
 
 if __name__ == "__main__":
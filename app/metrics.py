@@ -0,0 +1,224 @@
+import bisect
+import time
+from contextlib import contextmanager
+from typing import Any, Awaitable, Callable, Iterable, Optional
+
+from aiohttp import web
+from aiogram import BaseMiddleware, Router
+from aiogram.dispatcher.event.bases import SkipHandler
+from aiogram.types import TelegramObject
+
+# Метрики процесса в текстовом формате Prometheus.
+# Без внешних зависимостей: счётчики и гистограммы живут в памяти,
+# /metrics отдаёт их снимок.
+
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+LabelValues = tuple[str, ...]
+
+
+def _fmt_labels(names: tuple[str, ...], values: LabelValues, extra: str = "") -> str:
+    pairs = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _fmt_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, doc: str, labels: tuple[str, ...] = ()):
+        self.name = name
+        self.doc = doc
+        self.labels = labels
+
+    def _key(self, values: Iterable[str]) -> LabelValues:
+        key = tuple(str(v) for v in values)
+        if len(key) != len(self.labels):
+            raise ValueError(f"{self.name}: expected labels {self.labels}, got {key}")
+        return key
+
+    def samples(self) -> Iterable[str]:
+        return ()
+
+    def render(self) -> str:
+        lines = [f"# HELP {self.name} {self.doc}", f"# TYPE {self.name} {self.kind}"]
+        lines.extend(self.samples())
+        return "\n".join(lines)
+
+
+class _Value(_Metric):
+    # Значение либо меняется вызовами, либо читается функцией в момент сбора:
+    # fn() возвращает число или {значение метки: число} для одной метки
+    def __init__(self, name: str, doc: str, labels: tuple[str, ...] = (), fn: Optional[Callable[[], Any]] = None):
+        super().__init__(name, doc, labels)
+        self._values: dict[LabelValues, float] = {}
+        self._fn = fn
+
+    def samples(self) -> Iterable[str]:
+        values = self._values
+        if self._fn is not None:
+            got = self._fn()
+            values = {(str(k),): v for k, v in got.items()} if isinstance(got, dict) else {(): got}
+        for key, value in sorted(values.items()):
+            yield f"{self.name}{_fmt_labels(self.labels, key)} {_fmt_value(value)}"
+
+
+class Counter(_Value):
+    kind = "counter"
+
+    def inc(self, *label_values: str, amount: float = 1):
+        key = self._key(label_values)
+        self._values[key] = self._values.get(key, 0) + amount
+
+
+class Gauge(_Value):
+    kind = "gauge"
+
+    def set(self, value: float, *label_values: str):
+        self._values[self._key(label_values)] = value
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, doc: str, labels: tuple[str, ...] = (), buckets: tuple[float, ...] = DEFAULT_BUCKETS):
+        super().__init__(name, doc, labels)
+        self._bounds = tuple(sorted(buckets))
+        # label values -> (счётчики по корзинам, сумма, количество)
+        self._series: dict[LabelValues, list] = {}
+
+    def observe(self, value: float, *label_values: str):
+        key = self._key(label_values)
+        series = self._series.get(key)
+        if series is None:
+            series = self._series[key] = [[0] * len(self._bounds), 0.0, 0]
+        idx = bisect.bisect_left(self._bounds, value)
+        if idx < len(self._bounds):
+            series[0][idx] += 1
+        series[1] += value
+        series[2] += 1
+
+    @contextmanager
+    def time(self, *label_values: str):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, *label_values)
+
+    def samples(self) -> Iterable[str]:
+        for key, (counts, total, count) in sorted(self._series.items()):
+            cumulative = 0
+            for bound, c in zip(self._bounds, counts):
+                cumulative += c
+                le = 'le="%s"' % _fmt_value(float(bound))
+                yield f"{self.name}_bucket{_fmt_labels(self.labels, key, le)} {cumulative}"
+            le = 'le="+Inf"'
+            yield f"{self.name}_bucket{_fmt_labels(self.labels, key, le)} {count}"
+            yield f"{self.name}_sum{_fmt_labels(self.labels, key)} {_fmt_value(total)}"
+            yield f"{self.name}_count{_fmt_labels(self.labels, key)} {count}"
+
+
+class Registry:
+    def __init__(self):
+        self._metrics: dict[str, _Metric] = {}
+
+    def register(self, metric: _Metric) -> _Metric:
+        if metric.name in self._metrics:
+            raise ValueError(f"metric {metric.name} already registered")
+        self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, doc: str, labels: tuple[str, ...] = (), fn: Optional[Callable[[], Any]] = None) -> Counter:
+        return self.register(Counter(name, doc, labels, fn))
+
+    def gauge(self, name: str, doc: str, labels: tuple[str, ...] = (), fn: Optional[Callable[[], Any]] = None) -> Gauge:
+        return self.register(Gauge(name, doc, labels, fn))
+
+    def histogram(self, name: str, doc: str, labels: tuple[str, ...] = (), buckets: tuple[float, ...] = DEFAULT_BUCKETS) -> Histogram:
+        return self.register(Histogram(name, doc, labels, buckets))
+
+    def render(self) -> str:
+        return "\n".join(m.render() for m in self._metrics.values()) + "\n"
+
+
+registry = Registry()
+
+
+# ---------- общие метрики ----------
+
+HANDLER_SECONDS = registry.histogram("bot_handler_seconds", "Handler latency", ("handler",))
+HANDLER_TOTAL = registry.counter("bot_handler_total", "Handled updates by outcome", ("handler", "outcome"))
+
+DB_SECONDS = registry.histogram("bot_db_seconds", "db.py call latency", ("op",))
+DB_ERRORS = registry.counter("bot_db_errors_total", "db.py calls that raised", ("op",))
+DB_WAIT_SECONDS = registry.histogram("bot_db_wait_seconds", "Time waiting for a connection", ("kind",))
+
+SWEEP_SECONDS = registry.histogram("bot_sweep_seconds", "Background loop tick duration")
+SWEEP_DUE = registry.gauge("bot_sweep_due", "Events due in the last background tick", ("kind",))
+SWEEP_EXPIRED = registry.counter("bot_sweep_expired_total", "Tickets closed by the expiry sweep")
+
+ARCHIVE_SECONDS = registry.histogram("bot_archive_seconds", "Archive job run duration")
+ARCHIVE_TICKETS = registry.counter("bot_archive_tickets_total", "Tickets moved to or purged from the archive", ("action",))
+
+
+# ---------- /metrics ----------
+
+async def _handle_metrics(request: web.Request) -> web.Response:
+    return web.Response(text=registry.render(), content_type="text/plain", charset="utf-8")
+
+
+def add_metrics_route(app: web.Application, path: str = "/metrics"):
+    app.router.add_get(path, _handle_metrics)
+
+
+async def start_metrics_server(host: str, port: int) -> web.AppRunner:
+    app = web.Application()
+    add_metrics_route(app)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    await web.TCPSite(runner, host, port).start()
+    return runner
+
+
+# ---------- aiogram ----------
+
+class HandlerMetricsMiddleware(BaseMiddleware):
+    # Внутренний middleware: только здесь уже известно, какой хендлер сработал
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: dict[str, Any],
+    ) -> Any:
+        handler_obj = data.get("handler")
+        name = handler_obj.callback.__name__ if handler_obj is not None else "unknown"
+        outcome = "error"
+        started = time.perf_counter()
+        try:
+            result = await handler(event, data)
+            outcome = "ok"
+            return result
+        except SkipHandler:
+            outcome = "skipped"
+            raise
+        finally:
+            HANDLER_SECONDS.observe(time.perf_counter() - started, name)
+            HANDLER_TOTAL.inc(name, outcome)
+
+
+def instrument_router(router: Router):
+    middleware = HandlerMetricsMiddleware()
+    router.message.middleware(middleware)
+    router.callback_query.middleware(middleware)
@@ -0,0 +1,61 @@
+import time
+from collections import Counter
+from typing import Iterable, Optional
+
+
+class OperatorPool:
+    # Зеркало таблицы operators в памяти + длина открытой очереди каждого оператора.
+    # Обновляется функциями db.py, поэтому выбор оператора не ходит в БД.
+
+    def __init__(self):
+        self._on_duty: dict[int, bool] = {}
+        self._open: Counter[int] = Counter()
+        self._last_assigned: dict[int, float] = {}
+
+    def load(self, operators: Iterable[dict], open_counts: dict[int, int]):
+        self._on_duty = {row["user_id"]: bool(row["on_duty"]) for row in operators}
+        self._open = Counter({op: cnt for op, cnt in open_counts.items() if op is not None})
+        self._last_assigned.clear()
+
+    def is_operator(self, user_id: int) -> bool:
+        return user_id in self._on_duty
+
+    def is_on_duty(self, user_id: Optional[int]) -> bool:
+        return bool(self._on_duty.get(user_id))
+
+    def queue_length(self, user_id: int) -> int:
+        return self._open[user_id]
+
+    def snapshot(self) -> list[tuple[int, bool, int]]:
+        return [(op, duty, self._open[op]) for op, duty in sorted(self._on_duty.items())]
+
+    def pick(self, exclude: Optional[int] = None) -> Optional[int]:
+        # Оператор на смене с самой короткой очередью; при равенстве — тот,
+        # кому дольше всего ничего не назначали
+        candidates = [op for op, duty in self._on_duty.items() if duty and op != exclude]
+        if not candidates:
+            return None
+        return min(candidates, key=lambda op: (self._open[op], self._last_assigned.get(op, 0.0)))
+
+    def add(self, user_id: int, on_duty: bool = True):
+        self._on_duty.setdefault(user_id, on_duty)
+
+    def remove(self, user_id: int):
+        self._on_duty.pop(user_id, None)
+        self._last_assigned.pop(user_id, None)
+
+    def set_duty(self, user_id: int, on_duty: bool):
+        if user_id in self._on_duty:
+            self._on_duty[user_id] = on_duty
+
+    def assigned(self, user_id: Optional[int]):
+        if user_id is not None:
+            self._open[user_id] += 1
+            self._last_assigned[user_id] = time.monotonic()
+
+    def released(self, user_id: Optional[int]):
+        if user_id is not None and self._open[user_id] > 0:
+            self._open[user_id] -= 1
+
+
+operator_pool = OperatorPool()
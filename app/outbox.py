@@ -0,0 +1,215 @@
+import asyncio
+import contextlib
+import itertools
+import logging
+import time
+from dataclasses import dataclass
+from typing import Any, Optional, Union
+
+from aiogram import Bot
+from aiogram.exceptions import TelegramNetworkError, TelegramRetryAfter, TelegramServerError
+from aiogram.methods import SendMessage
+from aiogram.methods.base import TelegramMethod
+
+try:
+    from .metrics import registry
+except ImportError:
+    from metrics import registry
+
+logger = logging.getLogger(__name__)
+
+# Лимиты Bot API: ~30 сообщений/с на бота, ~1/с в личный чат, 20/мин в группу
+GLOBAL_RATE = 30
+CHAT_RATE = 1
+GROUP_RATE = 20 / 60
+
+WORKERS = 4
+MAX_RETRIES = 5
+BACKOFF_BASE_SEC = 1
+MAX_CHAT_BUCKETS = 10_000
+
+# Приоритеты: меньше — важнее
+PRIORITY_REPLY = 0     # ответы админа игрокам
+PRIORITY_NOTIFY = 1    # новые заявки, закрытие, вызов оператора
+PRIORITY_REMIND = 2    # напоминания и автоочистка
+
+ChatId = Union[int, str]
+
+
+class TokenBucket:
+    def __init__(self, rate: float, capacity: float = 1):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.paused_until = 0.0
+
+    def _refill(self, now: float):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def delay(self, now: float) -> float:
+        # через сколько секунд появится токен (0 — можно отправлять)
+        self._refill(now)
+        wait = 0.0 if self.tokens >= 1 else (1 - self.tokens) / self.rate
+        return max(wait, self.paused_until - now)
+
+    def take(self, now: float):
+        self._refill(now)
+        self.tokens -= 1
+
+    def pause(self, now: float, seconds: float):
+        self.paused_until = max(self.paused_until, now + seconds)
+
+    def is_idle(self, now: float) -> bool:
+        self._refill(now)
+        return self.tokens >= self.capacity and now >= self.paused_until
+
+
+@dataclass
+class _Outgoing:
+    method: TelegramMethod
+    future: asyncio.Future
+    attempts: int = 0
+
+
+class Outbox:
+    # Очередь исходящих сообщений с приоритетами.
+    # Перед отправкой берётся токен из общего ведра и из ведра конкретного чата;
+    # если токена нет, сообщение откладывается и не держит воркер.
+
+    def __init__(self):
+        self._bot: Optional[Bot] = None
+        self._queue: Optional[asyncio.PriorityQueue] = None
+        self._seq = itertools.count()
+        self._global = TokenBucket(GLOBAL_RATE, GLOBAL_RATE)
+        self._chats: dict[ChatId, TokenBucket] = {}
+        self._workers: list[asyncio.Task] = []
+        self._delayed: dict[int, tuple[asyncio.TimerHandle, _Outgoing]] = {}
+        self._pending = 0
+        self._idle = asyncio.Event()
+        self.stats = {"queued": 0, "sent": 0, "dropped": 0, "retried": 0}
+
+    def start(self, bot: Bot):
+        self._bot = bot
+        self._queue = asyncio.PriorityQueue()
+        self._idle.set()
+        self._workers = [asyncio.create_task(self._worker()) for _ in range(WORKERS)]
+
+    def submit(self, method: TelegramMethod, priority: int = PRIORITY_NOTIFY) -> asyncio.Future:
+        if self._queue is None:
+            raise RuntimeError("Outbox is not started")
+
+        future = asyncio.get_running_loop().create_future()
+        # результат нужен не всем: не даём asyncio ругаться на «неполученную» ошибку
+        future.add_done_callback(lambda f: f.cancelled() or f.exception())
+
+        self.stats["queued"] += 1
+        self._pending += 1
+        self._idle.clear()
+        self._put(priority, _Outgoing(method=method, future=future))
+        return future
+
+    def send_message(self, chat_id: ChatId, text: str, priority: int = PRIORITY_NOTIFY, **kwargs: Any) -> asyncio.Future:
+        return self.submit(SendMessage(chat_id=chat_id, text=text, **kwargs), priority)
+
+    async def drain(self, timeout: float):
+        # Дожидаемся отправки очереди при остановке, остальное отбрасываем
+        with contextlib.suppress(asyncio.TimeoutError):
+            await asyncio.wait_for(self._idle.wait(), timeout)
+
+        for task in self._workers:
+            task.cancel()
+        for task in self._workers:
+            with contextlib.suppress(asyncio.CancelledError):
+                await task
+        self._workers = []
+
+        leftovers = [item for _, item in self._delayed.values()]
+        for handle, _ in self._delayed.values():
+            handle.cancel()
+        self._delayed.clear()
+        while not self._queue.empty():
+            leftovers.append(self._queue.get_nowait()[2])
+
+        for item in leftovers:
+            self._finish(item, error=RuntimeError("Outbox stopped"))
+
+    def _put(self, priority: int, item: _Outgoing):
+        self._queue.put_nowait((priority, next(self._seq), item))
+
+    def _defer(self, priority: int, item: _Outgoing, delay: float):
+        key = next(self._seq)
+
+        def release():
+            del self._delayed[key]
+            self._put(priority, item)
+
+        self._delayed[key] = (asyncio.get_running_loop().call_later(delay, release), item)
+
+    def _chat_bucket(self, chat_id: ChatId) -> TokenBucket:
+        bucket = self._chats.get(chat_id)
+        if bucket is None:
+            if len(self._chats) >= MAX_CHAT_BUCKETS:
+                now = time.monotonic()
+                self._chats = {cid: b for cid, b in self._chats.items() if not b.is_idle(now)}
+            is_group = isinstance(chat_id, str) or chat_id < 0
+            bucket = self._chats[chat_id] = TokenBucket(GROUP_RATE if is_group else CHAT_RATE)
+        return bucket
+
+    async def _worker(self):
+        while True:
+            priority, _, item = await self._queue.get()
+
+            now = time.monotonic()
+            bucket = self._chat_bucket(item.method.chat_id)
+            wait = max(self._global.delay(now), bucket.delay(now))
+            if wait > 0:
+                self._defer(priority, item, wait)
+                continue
+            self._global.take(now)
+            bucket.take(now)
+
+            try:
+                result = await self._bot(item.method)
+            except TelegramRetryAfter as e:
+                bucket.pause(time.monotonic(), e.retry_after)
+                self._retry(priority, item, e, e.retry_after)
+            except (TelegramNetworkError, TelegramServerError) as e:
+                self._retry(priority, item, e, BACKOFF_BASE_SEC * 2 ** item.attempts)
+            except Exception as e:
+                self._finish(item, error=e)
+            else:
+                self._finish(item, result=result)
+
+    def _retry(self, priority: int, item: _Outgoing, error: Exception, delay: float):
+        item.attempts += 1
+        if item.attempts > MAX_RETRIES:
+            self._finish(item, error=error)
+            return
+        self.stats["retried"] += 1
+        self._defer(priority, item, delay)
+
+    def _finish(self, item: _Outgoing, result: Any = None, error: Optional[Exception] = None):
+        if error is None:
+            self.stats["sent"] += 1
+            if not item.future.done():
+                item.future.set_result(result)
+        else:
+            self.stats["dropped"] += 1
+            logger.warning(
+                "event=send_dropped method=%s chat_id=%s attempts=%d error=%r",
+                type(item.method).__name__, item.method.chat_id, item.attempts, error
+            )
+            if not item.future.done():
+                item.future.set_exception(error)
+
+        self._pending -= 1
+        if self._pending == 0:
+            self._idle.set()
+
+
+outbox = Outbox()
+
+registry.counter("bot_outbox_messages_total", "Outbox messages by result", ("result",), fn=lambda: outbox.stats)
+registry.gauge("bot_outbox_pending", "Messages queued or in flight", fn=lambda: outbox._pending)
@@ -0,0 +1,149 @@
+import asyncio
+import logging
+from collections import OrderedDict, deque
+from dataclasses import dataclass
+from typing import Optional
+
+try:
+    from .db import load_recent_limits, save_user_limits
+except ImportError:
+    from db import load_recent_limits, save_user_limits
+
+logger = logging.getLogger(__name__)
+
+# Действия, которые ограничиваем
+TICKET = "ticket"
+CALL = "call"
+
+# Причины отказа
+COOLDOWN = "cooldown"
+WINDOW = "window"
+
+MAX_TRACKED = 50_000
+FLUSH_INTERVAL_SEC = 5
+# Что пишется в user_limits отсюда. Отметку TICKET ставит submit_ticket
+# в транзакции создания заявки: второй писатель той же колонки мог бы
+# опередить её и отклонить эту же заявку по кулдауну.
+WRITE_BEHIND = (CALL,)
+
+
+@dataclass(frozen=True)
+class Rule:
+    cooldown_sec: int
+    window_sec: int = 0
+    max_per_window: int = 0
+
+    @property
+    def horizon(self) -> int:
+        return max(self.cooldown_sec, self.window_sec)
+
+
+class RateLimiter:
+    # Скользящее окно в памяти процесса: по каждому (user_id, action) храним
+    # отметки времени успешных действий не старше окна. Отказ не трогает БД,
+    # успешные действия WRITE_BEHIND пачками пишутся в user_limits.
+
+    def __init__(self, max_tracked: int = MAX_TRACKED):
+        self._rules: dict[str, Rule] = {}
+        self._hits: OrderedDict[tuple[int, str], deque[int]] = OrderedDict()
+        self._dirty: dict[tuple[int, str], int] = {}
+        self._max_tracked = max_tracked
+
+    def configure(self, action: str, rule: Rule):
+        self._rules[action] = rule
+
+    def __len__(self) -> int:
+        return len(self._hits)
+
+    def try_acquire(self, user_id: int, action: str, now: int) -> tuple[Optional[str], int]:
+        # (None, 0) — можно; иначе (причина, сколько секунд ждать).
+        # Проверка и запись идут без await, так что двойной клик не проскочит.
+        rule = self._rules[action]
+        key = (user_id, action)
+
+        hits = self._hits.get(key)
+        if hits is None:
+            hits = self._hits[key] = deque()
+        else:
+            self._hits.move_to_end(key)
+            while hits and hits[0] < now - rule.horizon:
+                hits.popleft()
+
+        if hits and now - hits[-1] < rule.cooldown_sec:
+            return COOLDOWN, rule.cooldown_sec - (now - hits[-1])
+
+        if rule.max_per_window:
+            in_window = [ts for ts in hits if ts >= now - rule.window_sec]
+            if len(in_window) >= rule.max_per_window:
+                return WINDOW, in_window[0] + rule.window_sec - now
+
+        hits.append(now)
+        if action in WRITE_BEHIND:
+            self._dirty[key] = now
+        self._evict(now)
+        return None, 0
+
+    def release(self, user_id: int, action: str, ts: int):
+        # Откат отметки из try_acquire, если само действие не состоялось
+        key = (user_id, action)
+        hits = self._hits.get(key)
+        if hits is None or ts not in hits:
+            return
+        hits.remove(ts)
+        if self._dirty.get(key) == ts:
+            del self._dirty[key]
+            if hits:
+                self._dirty[key] = hits[-1]
+
+    def _evict(self, now: int):
+        # сначала выкидываем тех, у кого окно уже истекло, потом — самых давних
+        while self._hits:
+            (user_id, action), hits = next(iter(self._hits.items()))
+            expired = not hits or hits[-1] < now - self._rules[action].horizon
+            if not expired and len(self._hits) <= self._max_tracked:
+                return
+            self._hits.popitem(last=False)
+
+    async def load(self, now: int):
+        # Восстанавливаем окна после перезапуска
+        horizon = max((r.horizon for r in self._rules.values()), default=0)
+        limits, ticket_ts = await load_recent_limits(now - horizon)
+
+        stamps: dict[tuple[int, str], set[int]] = {}
+        for row in limits:
+            if row["last_ticket_ts"]:
+                stamps.setdefault((row["user_id"], TICKET), set()).add(int(row["last_ticket_ts"]))
+            if row["last_call_ts"]:
+                stamps.setdefault((row["user_id"], CALL), set()).add(int(row["last_call_ts"]))
+        for row in ticket_ts:
+            stamps.setdefault((row["user_id"], TICKET), set()).add(int(row["created_ts"]))
+
+        self._hits.clear()
+        for key, ts in stamps.items():
+            if key[1] in self._rules:
+                self._hits[key] = deque(sorted(ts))
+        self._evict(now)
+
+    async def flush(self):
+        if not self._dirty:
+            return
+        dirty, self._dirty = self._dirty, {}
+
+        try:
+            await save_user_limits({uid: ts for (uid, action), ts in dirty.items() if action == CALL})
+        except Exception:
+            # вернём несохранённое, не затирая более свежие отметки
+            for key, ts in dirty.items():
+                self._dirty[key] = max(ts, self._dirty.get(key, 0))
+            raise
+
+    async def run_flusher(self):
+        while True:
+            await asyncio.sleep(FLUSH_INTERVAL_SEC)
+            try:
+                await self.flush()
+            except Exception:
+                logger.exception("event=limits_flush_error dirty=%d", len(self._dirty))
+
+
+rate_limiter = RateLimiter()
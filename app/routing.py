@@ -0,0 +1,75 @@
+import asyncio
+import logging
+from typing import Optional
+
+try:
+    from .db import link_admin_message, reassign_ticket, list_attachments
+    from .attachments import attachment_methods
+    from .keyboards import admin_ticket_kb
+    from .operators import operator_pool
+    from .outbox import outbox, PRIORITY_NOTIFY
+except ImportError:
+    from db import link_admin_message, reassign_ticket, list_attachments
+    from attachments import attachment_methods
+    from keyboards import admin_ticket_kb
+    from operators import operator_pool
+    from outbox import outbox, PRIORITY_NOTIFY
+
+logger = logging.getLogger(__name__)
+
+
+def pick_operator(fallback: int, exclude: Optional[int] = None) -> int:
+    # Если на смене никого нет — всё уходит главному админу
+    return operator_pool.pick(exclude=exclude) or fallback
+
+
+def ticket_card(ticket: dict, title: str, attachments: int = 0) -> str:
+    uname = f"@{ticket['username']}" if ticket["username"] else "(без username)"
+    files = f"📎 Вложений: {attachments} (ниже)\n\n" if attachments else ""
+    return (
+        f"{title} #{ticket['id']}\n"
+        f"От: {ticket['user_id']} {uname}\n"
+        f"Дата: {ticket['created_at']}\n\n"
+        f"{ticket['message'] or '(без текста)'}\n\n"
+        f"{files}"
+        f"💡 Ответьте на это сообщение (Reply) — бот отправит ответ игроку."
+    )
+
+
+async def send_ticket_card(
+    ticket: dict,
+    operator_id: int,
+    title: str = "🆕 Новая заявка",
+    attachments: Optional[list[dict]] = None,
+):
+    # attachments=None — вложения читаются из БД (передача заявки другому оператору)
+    try:
+        if attachments is None:
+            attachments = await list_attachments(ticket["id"])
+        sent = await outbox.send_message(
+            operator_id,
+            ticket_card(ticket, title, len(attachments)),
+            reply_markup=admin_ticket_kb(ticket["id"]),
+            priority=PRIORITY_NOTIFY
+        )
+        await link_admin_message(sent.chat.id, sent.message_id, ticket["id"])
+        # файлы уходят по file_id ответом на карточку: альбом — одним send_media_group
+        for method in attachment_methods(sent.chat.id, attachments, reply_to=sent.message_id):
+            await outbox.submit(method, PRIORITY_NOTIFY)
+    except Exception as e:
+        logger.error("event=admin_send_error ticket_id=%s operator_id=%s error=%r", ticket["id"], operator_id, e)
+
+
+async def hand_over(tickets: list[dict]) -> int:
+    # Передаёт заявки другим операторам на смене (каждую — с самой короткой очередью).
+    # Возвращает, сколько заявок удалось передать.
+    moved = []
+    for t in tickets:
+        target = operator_pool.pick(exclude=t["assigned_to"])
+        if target is None:
+            break
+        if await reassign_ticket(t["id"], target):
+            moved.append(send_ticket_card({**t, "assigned_to": target}, target, title="🔁 Вам передана заявка"))
+
+    await asyncio.gather(*moved)
+    return len(moved)
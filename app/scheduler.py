@@ -0,0 +1,136 @@
+import asyncio
+import contextlib
+import heapq
+import time
+from dataclasses import dataclass
+from typing import Iterable, Optional
+
+try:
+    from .metrics import registry
+except ImportError:
+    from metrics import registry
+
+# Настройки автоочистки и напоминаний
+TICKET_TTL_SEC = 30 * 60
+REMIND_AFTER_SEC = 5 * 60
+REMIND_EVERY_SEC = 10 * 60
+
+# Если событие забрали из очереди, но не обработали (ошибка отправки и т.п.),
+# заявка вернётся в очередь через это время
+RETRY_AFTER_SEC = 60
+
+EXPIRE = "expire"
+REMIND = "remind"
+
+
+@dataclass
+class _TicketTimers:
+    created_ts: int
+    replied: bool
+    last_remind_ts: int
+    version: int = 0
+
+    def next_deadline(self) -> tuple[int, str]:
+        expire_at = self.created_ts + TICKET_TTL_SEC
+        if self.replied:
+            return expire_at, EXPIRE
+
+        remind_at = max(self.created_ts + REMIND_AFTER_SEC, self.last_remind_ts + REMIND_EVERY_SEC)
+        if remind_at < expire_at:
+            return remind_at, REMIND
+        return expire_at, EXPIRE
+
+
+class TicketScheduler:
+    # Очередь ближайших дедлайнов по открытым заявкам (min-heap).
+    # На каждую заявку в куче живёт одна актуальная запись; старые записи
+    # не ищутся и не удаляются, а отбрасываются при выборке по version.
+
+    def __init__(self):
+        self._heap: list[tuple[float, int, int, str]] = []  # (deadline, ticket_id, version, kind)
+        self._tickets: dict[int, _TicketTimers] = {}
+        self._wakeup = asyncio.Event()
+
+    def __len__(self) -> int:
+        return len(self._tickets)
+
+    def load(self, rows: Iterable[dict]):
+        self._heap.clear()
+        self._tickets.clear()
+        for row in rows:
+            self.add(
+                row["id"],
+                int(row["created_ts"]),
+                replied=row["last_admin_reply_ts"] is not None,
+                last_remind_ts=int(row["last_admin_remind_ts"] or 0),
+            )
+
+    def add(self, ticket_id: int, created_ts: int, replied: bool = False, last_remind_ts: int = 0):
+        timers = _TicketTimers(created_ts=created_ts, replied=replied, last_remind_ts=last_remind_ts)
+        self._tickets[ticket_id] = timers
+        self._push(ticket_id, timers, *timers.next_deadline())
+
+    def replied(self, ticket_id: int):
+        timers = self._tickets.get(ticket_id)
+        if timers:
+            timers.replied = True
+            self._push(ticket_id, timers, *timers.next_deadline())
+
+    def reminded(self, ticket_id: int, ts: int):
+        timers = self._tickets.get(ticket_id)
+        if timers:
+            timers.last_remind_ts = ts
+            self._push(ticket_id, timers, *timers.next_deadline())
+
+    def remove(self, ticket_id: int):
+        # запись в куче останется, но станет «чужой» и будет отброшена
+        self._tickets.pop(ticket_id, None)
+
+    def _push(self, ticket_id: int, timers: _TicketTimers, deadline: float, kind: str):
+        timers.version += 1
+        top = self._peek()
+        heapq.heappush(self._heap, (deadline, ticket_id, timers.version, kind))
+        if top is None or deadline < top[0]:
+            self._wakeup.set()
+
+    def _peek(self) -> Optional[tuple[float, int, int, str]]:
+        while self._heap:
+            deadline, tid, version, kind = self._heap[0]
+            timers = self._tickets.get(tid)
+            if timers is not None and timers.version == version:
+                return self._heap[0]
+            heapq.heappop(self._heap)
+        return None
+
+    def pop_due(self, now: float) -> list[tuple[int, str]]:
+        due = []
+        while (top := self._peek()) is not None and top[0] <= now:
+            heapq.heappop(self._heap)
+            _, tid, _, kind = top
+            timers = self._tickets[tid]
+            # после простоя напоминать о заявке, которую пора удалять, незачем
+            if timers.created_ts + TICKET_TTL_SEC <= now:
+                kind = EXPIRE
+            due.append((tid, kind))
+            # страховка: если обработчик не вызовет reminded()/remove(), повторим позже
+            self._push(tid, timers, now + RETRY_AFTER_SEC, kind)
+        return due
+
+    async def wait_due(self) -> list[tuple[int, str]]:
+        # Спим ровно до ближайшего дедлайна (или до появления более раннего)
+        while True:
+            now = time.time()
+            due = self.pop_due(now)
+            if due:
+                return due
+
+            self._wakeup.clear()
+            top = self._peek()
+            timeout = None if top is None else top[0] - now
+            with contextlib.suppress(asyncio.TimeoutError):
+                await asyncio.wait_for(self._wakeup.wait(), timeout)
+
+
+ticket_scheduler = TicketScheduler()
+
+registry.gauge("bot_scheduler_tickets", "Open tickets tracked by the scheduler", fn=lambda: len(ticket_scheduler))
@@ -1,2 +1,26 @@
 BOT_TOKEN = "8421746932:AAFJ4Qx0boUnyU4m3G3TAFij5CK26I-U9ok"
 ADMIN_ID = 1113996892
+
+# Режим получения апдейтов: пустой WEBHOOK_URL — long polling,
+# иначе бот поднимает HTTP-сервер и регистрирует этот адрес в Telegram
+WEBHOOK_URL = ""  # например "https://bot.example.com/tg/webhook"
+WEBHOOK_SECRET = ""
+WEBHOOK_LISTEN_HOST = "0.0.0.0"
+WEBHOOK_LISTEN_PORT = 8080
+
+# Доска очереди: одно закреплённое сообщение у админа со списком открытых
+# заявок вместо отдельных напоминаний и уведомлений об автоочистке
+QUEUE_BOARD = False
+
+# Метрики в формате Prometheus на http://HOST:PORT/metrics; порт 0 — выключено
+METRICS_LISTEN_HOST = "127.0.0.1"
+METRICS_LISTEN_PORT = 9108
+
+# Свой сервер Bot API (локальный telegram-bot-api или bench/fake_api.py); пусто — api.telegram.org
+BOT_API_SERVER = ""
+
+# Закрытые заявки сколько-то дней остаются в основной таблице (поиск /find),
+# затем уезжают в сжатый архив; статус по номеру доступен и из архива.
+# Срок хранения архива в днях; 0 — хранить всегда
+ARCHIVE_AFTER_DAYS = 7
+ARCHIVE_RETENTION_DAYS = 365
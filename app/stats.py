@@ -0,0 +1,164 @@
+import math
+from collections import Counter
+from typing import Iterable, Optional
+
+try:
+    from .metrics import registry
+except ImportError:
+    from metrics import registry
+
+# Статистика поддержки по часовым корзинам. db.py сообщает о событиях после
+# COMMIT, каждый процесс копит свои приращения и раз в STATS_FLUSH_SEC
+# складывает их в stats_rollup (значения суммируются, так что процессы
+# не мешают друг другу), после чего перечитывает окно из БД.
+# /stats считает по памяти: объём работы зависит от числа корзин, а не заявок.
+STATS_BUCKET_SEC = 3600
+STATS_WINDOW_HOURS = 24
+STATS_FLUSH_SEC = 60
+STATS_RETENTION_DAYS = 90
+
+# События
+OPENED = "opened"
+REPLIED = "replied"
+FIRST_REPLY = "first_reply"
+REMINDED = "reminded"
+CLOSED = "closed"
+DELETED = "deleted"
+EXPIRED = "expired"
+# Время до первого ответа: логарифмические корзины (key — номер корзины)
+REPLY_TIME = "reply_time"
+# Кто чаще пишет: key — user_id, в каждой часовой корзине только USER_TOP_K лидеров
+USER_TICKETS = "user_tickets"
+
+# Относительная точность квантилей времени ответа
+SKETCH_ACCURACY = 0.05
+SKETCH_GAMMA = (1 + SKETCH_ACCURACY) / (1 - SKETCH_ACCURACY)
+USER_TOP_K = 20
+
+Key = tuple[int, str, int]  # (начало часа, событие, ключ)
+
+
+def bucket_of(ts: int) -> int:
+    return ts - ts % STATS_BUCKET_SEC
+
+
+def sketch_bin(seconds: float) -> int:
+    if seconds < 1:
+        return 0
+    return max(1, math.ceil(math.log(seconds, SKETCH_GAMMA)))
+
+
+def sketch_quantile(bins: dict[int, int], q: float) -> Optional[float]:
+    total = sum(bins.values())
+    if not total:
+        return None
+    rank = q * (total - 1)
+    seen = 0
+    for index in sorted(bins):
+        seen += bins[index]
+        if seen > rank:
+            # середина корзины (γ^(i-1), γ^i] с ошибкой не больше SKETCH_ACCURACY
+            return 0.0 if index == 0 else 2 * SKETCH_GAMMA ** index / (SKETCH_GAMMA + 1)
+    return None
+
+
+class SupportStats:
+    def __init__(self):
+        self._flushed: Counter[Key] = Counter()
+        self._pending: Counter[Key] = Counter()
+        # лидеры по числу заявок за час; в БД уходят, когда час закончился
+        self._users: dict[int, Counter[int]] = {}
+        self._open_base = 0
+        self._open_delta = 0
+
+    def __len__(self) -> int:
+        return len(self._flushed) + len(self._pending) + sum(map(len, self._users.values()))
+
+    # ---------- события (вызывает db.py) ----------
+
+    def opened(self, user_id: int, ts: int):
+        bucket = bucket_of(ts)
+        self._pending[(bucket, OPENED, 0)] += 1
+        self._count_user(bucket, user_id)
+        self._open_delta += 1
+
+    def replied(self, ts: int, first_reply_sec: Optional[int]):
+        bucket = bucket_of(ts)
+        self._pending[(bucket, REPLIED, 0)] += 1
+        if first_reply_sec is not None:
+            self._pending[(bucket, FIRST_REPLY, 0)] += 1
+            self._pending[(bucket, REPLY_TIME, sketch_bin(first_reply_sec))] += 1
+
+    def reminded(self, count: int, ts: int):
+        self._pending[(bucket_of(ts), REMINDED, 0)] += count
+
+    def closed(self, status: str, ts: int, count: int = 1):
+        self._pending[(bucket_of(ts), status, 0)] += count
+        self._open_delta -= count
+
+    def _count_user(self, bucket: int, user_id: int):
+        # Space-Saving: не больше USER_TOP_K пользователей на корзину,
+        # новичок вытесняет самого редкого и наследует его счёт
+        users = self._users.setdefault(bucket, Counter())
+        if user_id not in users and len(users) >= USER_TOP_K:
+            rarest = min(users, key=users.__getitem__)
+            users[user_id] = users.pop(rarest)
+        users[user_id] += 1
+
+    # ---------- сброс в БД ----------
+
+    def take_pending(self, now: int) -> list[tuple[int, str, int, int]]:
+        pending, self._pending = self._pending, Counter()
+        for bucket in [b for b in self._users if b < bucket_of(now)]:
+            for user_id, count in self._users.pop(bucket).items():
+                pending[(bucket, USER_TICKETS, user_id)] += count
+        return [(*key, value) for key, value in pending.items()]
+
+    def restore_pending(self, rows: Iterable[tuple]):
+        for bucket, metric, key, value in rows:
+            self._pending[(bucket, metric, key)] += value
+
+    def refresh(self, rows: Iterable[dict], open_count: int):
+        # окно из stats_rollup уже включает сброшенное этим процессом;
+        # число открытых сверяется с БД, расхождение за время запроса — до следующего сброса
+        self._flushed = Counter({(r["bucket_ts"], r["metric"], r["key"]): r["value"] for r in rows})
+        self._open_base = open_count
+        self._open_delta = 0
+
+    # ---------- отчёт ----------
+
+    def snapshot(self, now: int, top_users: int = 3) -> dict:
+        since = bucket_of(now) - (STATS_WINDOW_HOURS - 1) * STATS_BUCKET_SEC
+        last_hour = bucket_of(now)
+        day: Counter[str] = Counter()
+        hour: Counter[str] = Counter()
+        reply_bins: Counter[int] = Counter()
+        users: Counter[int] = Counter()
+
+        current_users = {(b, USER_TICKETS, uid): n for b, counts in self._users.items() for uid, n in counts.items()}
+        for source in (self._flushed, self._pending, current_users):
+            for (bucket, metric, key), value in source.items():
+                if bucket < since:
+                    continue
+                if metric == REPLY_TIME:
+                    reply_bins[key] += value
+                elif metric == USER_TICKETS:
+                    users[key] += value
+                else:
+                    day[metric] += value
+                    if bucket == last_hour:
+                        hour[metric] += value
+
+        return {
+            "open": max(0, self._open_base + self._open_delta),
+            "day": dict(day),
+            "hour": dict(hour),
+            "first_reply_p50": sketch_quantile(reply_bins, 0.5),
+            "first_reply_p90": sketch_quantile(reply_bins, 0.9),
+            "top_users": users.most_common(top_users),
+        }
+
+
+support_stats = SupportStats()
+
+registry.gauge("bot_stats_keys", "Stats rollup entries held in memory", fn=lambda: len(support_stats))
@@ -1,3 +1,48 @@
-# Связь: message_id (сообщение у админа) -> ticket_id
-# Хранится в памяти процесса. После перезапуска бота связи сбросятся.
-ADMIN_MSG_TO_TICKET: dict[int, int] = {}
+from collections import OrderedDict
+from typing import Optional
+
+# Связь: (чат админа, message_id) -> ticket_id.
+# Источник истины — таблица admin_messages в БД, здесь только LRU-кэш перед ней,
+# чтобы ответ админа не ходил в базу и память процесса не росла бесконечно.
+ADMIN_MSG_CACHE_SIZE = 5000
+
+AdminMessageKey = tuple[int, int]
+
+
+class AdminMessageCache:
+    def __init__(self, maxsize: int):
+        self._maxsize = maxsize
+        self._data: OrderedDict[AdminMessageKey, int] = OrderedDict()
+        self._by_ticket: dict[int, set[AdminMessageKey]] = {}
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def get(self, key: AdminMessageKey) -> Optional[int]:
+        tid = self._data.get(key)
+        if tid is not None:
+            self._data.move_to_end(key)
+        return tid
+
+    def put(self, key: AdminMessageKey, ticket_id: int):
+        self._data[key] = ticket_id
+        self._data.move_to_end(key)
+        self._by_ticket.setdefault(ticket_id, set()).add(key)
+
+        while len(self._data) > self._maxsize:
+            old_key, old_tid = self._data.popitem(last=False)
+            self._discard(old_tid, old_key)
+
+    def forget_ticket(self, ticket_id: int):
+        for key in self._by_ticket.pop(ticket_id, ()):
+            self._data.pop(key, None)
+
+    def _discard(self, ticket_id: int, key: AdminMessageKey):
+        keys = self._by_ticket.get(ticket_id)
+        if keys is not None:
+            keys.discard(key)
+            if not keys:
+                del self._by_ticket[ticket_id]
+
+
+ADMIN_MSG_TO_TICKET = AdminMessageCache(ADMIN_MSG_CACHE_SIZE)
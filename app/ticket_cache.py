@@ -0,0 +1,82 @@
+import time
+from collections import OrderedDict
+from typing import Any, Optional
+
+try:
+    from .metrics import registry
+except ImportError:
+    from metrics import registry
+
+# Кэш заявок перед get_ticket. Источник истины — таблица tickets,
+# db.py обновляет кэш после каждого COMMIT, TTL — страховка от пропущенного случая.
+TICKET_CACHE_SIZE = 2000
+TICKET_CACHE_TTL_SEC = 60
+# «Заявки нет» помним недолго: id мог быть ещё не выдан
+NEGATIVE_TTL_SEC = 10
+
+
+class TicketCache:
+    def __init__(self, maxsize: int, ttl_sec: float, negative_ttl_sec: float):
+        self._maxsize = maxsize
+        self._ttl_sec = ttl_sec
+        self._negative_ttl_sec = negative_ttl_sec
+        # ticket_id -> (годен до, заявка или None для «нет такой»)
+        self._data: OrderedDict[int, tuple[float, Optional[dict]]] = OrderedDict()
+        # растёт при каждой инвалидации; чтение, начатое до неё, в кэш не попадёт
+        self._epoch = 0
+        self.stats = {"hits": 0, "negative_hits": 0, "misses": 0}
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def token(self) -> int:
+        return self._epoch
+
+    def get(self, ticket_id: int) -> tuple[bool, Optional[dict]]:
+        # (True, заявка | None) — ответ из кэша; (False, None) — надо идти в БД
+        entry = self._data.get(ticket_id)
+        if entry is None or entry[0] < time.monotonic():
+            if entry is not None:
+                del self._data[ticket_id]
+            self.stats["misses"] += 1
+            return False, None
+
+        self._data.move_to_end(ticket_id)
+        ticket = entry[1]
+        if ticket is None:
+            self.stats["negative_hits"] += 1
+            return True, None
+        self.stats["hits"] += 1
+        return True, dict(ticket)
+
+    def put(self, ticket_id: int, ticket: Optional[dict], token: int):
+        if token != self._epoch:
+            return
+        self._store(ticket_id, dict(ticket) if ticket is not None else None)
+
+    def update(self, ticket_id: int, **fields: Any):
+        self._epoch += 1
+        entry = self._data.get(ticket_id)
+        if entry is not None and entry[1] is not None:
+            entry[1].update(fields)
+
+    def forget(self, ticket_id: int):
+        self._epoch += 1
+        self._data.pop(ticket_id, None)
+
+    def set_missing(self, ticket_id: int):
+        self._epoch += 1
+        self._store(ticket_id, None)
+
+    def _store(self, ticket_id: int, ticket: Optional[dict]):
+        ttl = self._ttl_sec if ticket is not None else self._negative_ttl_sec
+        self._data[ticket_id] = (time.monotonic() + ttl, ticket)
+        self._data.move_to_end(ticket_id)
+        while len(self._data) > self._maxsize:
+            self._data.popitem(last=False)
+
+
+ticket_cache = TicketCache(TICKET_CACHE_SIZE, TICKET_CACHE_TTL_SEC, NEGATIVE_TTL_SEC)
+
+registry.counter("bot_ticket_cache_lookups_total", "get_ticket cache lookups", ("result",), fn=lambda: ticket_cache.stats)
+registry.gauge("bot_ticket_cache_size", "Entries in the ticket cache", fn=lambda: len(ticket_cache))
@@ -0,0 +1,331 @@
+# Бенчмарк слоя данных app/db.py.
+#
+#   python bench/db_bench.py                              # 10k / 100k / 1M, вывод JSON в stdout
+#   python bench/db_bench.py --scales 10000 --out base.json
+#   python bench/db_bench.py --scales 10000 --baseline base.json
+#
+# Для каждого размера один раз засевается шаблонная БД (кэшируется в --workdir),
+# каждый прогон работает с её копией, так что close_ticket и create_ticket
+# не влияют на следующий запуск.
+
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import shutil
+import sqlite3
+import sys
+import time
+from datetime import datetime, timezone
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, "app"))
+
+import db  # noqa: E402
+from ticket_cache import ticket_cache  # noqa: E402
+
+DEFAULT_SCALES = (10_000, 100_000, 1_000_000)
+DEFAULT_OPS = 2000
+DEFAULT_CONCURRENCY = 32
+USER_LIMITS_ROWS = 5000
+OPERATORS = (1, 2, 3, 4)
+# Заявки засеваются за последние 30 минут, как в живой очереди
+SEED_SPAN_SEC = 30 * 60
+SEED_BATCH = 50_000
+# меняется при изменении засева, чтобы не брать старые шаблоны
+SEED_VERSION = 2
+
+# Тексты заявок: частые слова поддержки + синтетический словарь,
+# чтобы поиск работал и по частым, и по редким словам
+COMMON_WORDS = (
+    "сервер", "зайти", "не", "могу", "ошибка", "дюп", "алмазы", "читы", "бан", "донат",
+    "пропали", "вещи", "сундук", "спавн", "игрок", "гриф", "приват", "лаги", "вылетает", "пароль",
+)
+SYLLABLES = ("ка", "ро", "ми", "ту", "ле", "на", "зо", "би", "ва", "гу", "де", "шо", "пи", "ры", "ся", "ю")
+VOCABULARY_SIZE = 20_000
+
+# Насколько хуже базового прогона считается регрессией
+DEFAULT_THRESHOLD = 0.2
+
+
+# ---------- засев ----------
+
+def _template_path(workdir: str, scale: int) -> str:
+    return os.path.join(workdir, f"seed_v{SEED_VERSION}_{scale}.db")
+
+
+def vocabulary() -> list[str]:
+    rnd = random.Random(0)
+    words = set()
+    while len(words) < VOCABULARY_SIZE:
+        words.add("".join(rnd.choice(SYLLABLES) for _ in range(rnd.randint(3, 5))))
+    return sorted(words)
+
+
+def _message(rnd: random.Random, vocab: list[str]) -> str:
+    words = rnd.sample(COMMON_WORDS, 3) + [rnd.choice(vocab) for _ in range(rnd.randint(3, 8))]
+    rnd.shuffle(words)
+    return " ".join(words)
+
+
+async def _create_schema(path: str):
+    db.DB_PATH = path
+    await db.init_db()
+    await db.close_db()
+
+
+def _seed(path: str, scale: int, now: int):
+    rnd = random.Random(scale)
+    vocab = vocabulary()
+    users = max(USER_LIMITS_ROWS, scale // 10)
+    con = sqlite3.connect(path)
+    con.execute("PRAGMA journal_mode=WAL")
+    con.execute("PRAGMA synchronous=OFF")
+
+    def rows(start: int, count: int):
+        for _ in range(count):
+            created_ts = now - rnd.randrange(SEED_SPAN_SEC)
+            yield (
+                rnd.randrange(1, users + 1),
+                f"user{rnd.randrange(users)}",
+                _message(rnd, vocab),
+                created_ts,
+                datetime.fromtimestamp(created_ts, timezone.utc).strftime("%Y-%m-%d %H:%M:%S UTC"),
+                rnd.choice(OPERATORS),
+            )
+
+    for start in range(0, scale, SEED_BATCH):
+        con.executemany(
+            """INSERT INTO tickets (user_id, username, status, message, created_ts, created_at, assigned_to)
+               VALUES (?, ?, 'open', ?, ?, ?, ?)""",
+            rows(start, min(SEED_BATCH, scale - start))
+        )
+        con.commit()
+
+    con.executemany(
+        "INSERT OR IGNORE INTO user_limits (user_id, last_ticket_ts, last_call_ts) VALUES (?, ?, ?)",
+        ((uid, now - rnd.randrange(3600), now - rnd.randrange(3600)) for uid in range(1, USER_LIMITS_ROWS + 1))
+    )
+    con.executemany(
+        "INSERT OR IGNORE INTO operators (user_id, on_duty, added_ts) VALUES (?, 1, ?)",
+        ((op, now) for op in OPERATORS)
+    )
+    con.commit()
+    con.execute("ANALYZE")
+    con.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+    con.close()
+
+
+async def prepare(workdir: str, scale: int, now: int) -> str:
+    template = _template_path(workdir, scale)
+    if not os.path.exists(template):
+        started = time.perf_counter()
+        tmp = template + ".tmp"
+        for suffix in ("", "-wal", "-shm"):
+            if os.path.exists(tmp + suffix):
+                os.remove(tmp + suffix)
+        await _create_schema(tmp)
+        _seed(tmp, scale, now)
+        os.replace(tmp, template)
+        print(f"seeded {scale} tickets in {time.perf_counter() - started:.1f}s", file=sys.stderr)
+
+    work = os.path.join(workdir, f"run_{scale}.db")
+    for suffix in ("-wal", "-shm"):
+        if os.path.exists(work + suffix):
+            os.remove(work + suffix)
+    shutil.copyfile(template, work)
+    return work
+
+
+# ---------- операции ----------
+
+class Workload:
+    # Аргументы для каждого вызова; id для close_ticket не повторяются
+    def __init__(self, scale: int, now: int, seed: int = 1):
+        self.scale = scale
+        self.now = now
+        self.rnd = random.Random(seed)
+        self._close_ids = iter(self.rnd.sample(range(1, scale + 1), min(scale, 200_000)))
+        self._vocab = vocabulary()
+
+    def ticket_id(self) -> int:
+        return self.rnd.randrange(1, self.scale + 1)
+
+    def user_id(self) -> int:
+        return self.rnd.randrange(1, USER_LIMITS_ROWS + 1)
+
+    def search_text(self) -> str:
+        # как ищет админ: одно-два слова, часто с обрезанным окончанием
+        words = [self.rnd.choice(self._vocab)[:-1], self.rnd.choice(COMMON_WORDS)]
+        return " ".join(words[:self.rnd.randint(1, 2)])
+
+    def calls(self) -> dict:
+        now = self.now
+        return {
+            "create_ticket": lambda: db.create_ticket(self.user_id(), "bench", "bench ticket", now, "bench", 1),
+            "get_ticket": lambda: db.get_ticket(self.ticket_id()),
+            "list_open_tickets": lambda: db.list_open_tickets(),
+            "count_tickets_in_window": lambda: db.count_tickets_in_window(self.user_id(), now - 600),
+            "get_user_limits": lambda: db.get_user_limits(self.user_id()),
+            "mark_admin_replied": lambda: db.mark_admin_replied(self.ticket_id(), now),
+            "mark_admin_reminded": lambda: db.mark_admin_reminded(self.ticket_id(), now),
+            "close_ticket": lambda: db.close_ticket(next(self._close_ids), ts=now),
+            "search_tickets": lambda: db.search_tickets(self.search_text(), limit=6),
+            "search_tickets_common": lambda: db.search_tickets(self.rnd.choice(COMMON_WORDS), limit=6),
+        }
+
+
+def _percentile(sorted_values: list[float], q: float) -> float:
+    if not sorted_values:
+        return 0.0
+    idx = min(len(sorted_values) - 1, max(0, round(q * (len(sorted_values) - 1))))
+    return sorted_values[idx]
+
+
+async def _run(call, ops: int, concurrency: int) -> dict:
+    latencies: list[float] = []
+    remaining = ops
+
+    async def worker():
+        nonlocal remaining
+        while remaining > 0:
+            remaining -= 1
+            started = time.perf_counter()
+            await call()
+            latencies.append(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    return {
+        "n": len(latencies),
+        "p50_ms": round(_percentile(latencies, 0.50) * 1000, 4),
+        "p99_ms": round(_percentile(latencies, 0.99) * 1000, 4),
+        "max_ms": round(latencies[-1] * 1000, 4) if latencies else 0.0,
+        "ops_per_sec": round(len(latencies) / elapsed, 1) if elapsed else 0.0,
+    }
+
+
+async def bench_scale(args, scale: int, now: int) -> list[dict]:
+    path = await prepare(args.workdir, scale, now)
+    db.DB_PATH = path
+    await db.init_db()
+    try:
+        results = []
+        for concurrency in (1, args.concurrency):
+            # кэш get_ticket сбрасываем, чтобы прогоны не зависели от порядка
+            ticket_cache._data.clear()
+            workload = Workload(scale, now, seed=concurrency)
+            for op, call in workload.calls().items():
+                if args.only and op not in args.only:
+                    continue
+                stats = await _run(call, args.ops, concurrency)
+                row = {
+                    "scale": scale,
+                    "op": op,
+                    "mode": "serial" if concurrency == 1 else "concurrent",
+                    "concurrency": concurrency,
+                    **stats,
+                }
+                results.append(row)
+                print(
+                    f"{scale:>9} {op:<24} c={concurrency:<3} p50={row['p50_ms']:.3f}ms "
+                    f"p99={row['p99_ms']:.3f}ms {row['ops_per_sec']:.0f} ops/s",
+                    file=sys.stderr
+                )
+        return results
+    finally:
+        await db.close_db()
+
+
+# ---------- сравнение ----------
+
+def _key(row: dict) -> tuple:
+    return row["scale"], row["op"], row["mode"]
+
+
+def compare(current: list[dict], baseline: list[dict], threshold: float) -> list[dict]:
+    base = {_key(r): r for r in baseline}
+    diff = []
+    for row in current:
+        old = base.get(_key(row))
+        if old is None:
+            continue
+        p50 = row["p50_ms"] / old["p50_ms"] if old["p50_ms"] else 1.0
+        p99 = row["p99_ms"] / old["p99_ms"] if old["p99_ms"] else 1.0
+        ops = row["ops_per_sec"] / old["ops_per_sec"] if old["ops_per_sec"] else 1.0
+        diff.append({
+            "scale": row["scale"],
+            "op": row["op"],
+            "mode": row["mode"],
+            "p50_ratio": round(p50, 3),
+            "p99_ratio": round(p99, 3),
+            "ops_ratio": round(ops, 3),
+            "regression": p50 > 1 + threshold or ops < 1 - threshold,
+        })
+    return diff
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark app/db.py")
+    parser.add_argument("--scales", type=int, nargs="+", default=list(DEFAULT_SCALES))
+    parser.add_argument("--ops", type=int, default=DEFAULT_OPS, help="calls per operation and mode")
+    parser.add_argument("--concurrency", type=int, default=DEFAULT_CONCURRENCY)
+    parser.add_argument("--only", nargs="+", help="run only these operations")
+    parser.add_argument("--workdir", default=os.path.join(ROOT, "bench", ".data"))
+    parser.add_argument("--out", help="write JSON here instead of stdout")
+    parser.add_argument("--baseline", help="JSON from a previous run to compare against")
+    parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD)
+    return parser.parse_args(argv)
+
+
+async def main(argv=None) -> int:
+    args = parse_args(argv)
+    os.makedirs(args.workdir, exist_ok=True)
+    now = int(time.time())
+
+    results = []
+    for scale in args.scales:
+        results.extend(await bench_scale(args, scale, now))
+
+    report = {
+        "meta": {
+            "ts": now,
+            "python": platform.python_version(),
+            "sqlite": sqlite3.sqlite_version,
+            "platform": platform.platform(),
+            "ops": args.ops,
+            "concurrency": args.concurrency,
+        },
+        "results": results,
+    }
+
+    exit_code = 0
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)["results"]
+        report["comparison"] = compare(results, baseline, args.threshold)
+        for row in report["comparison"]:
+            if row["regression"]:
+                exit_code = 1
+                print(
+                    f"REGRESSION {row['scale']} {row['op']} {row['mode']}: "
+                    f"p50 x{row['p50_ratio']}, ops/s x{row['ops_ratio']}",
+                    file=sys.stderr
+                )
+
+    text = json.dumps(report, ensure_ascii=False, indent=2)
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+    return exit_code
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main()))
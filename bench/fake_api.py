@@ -0,0 +1,202 @@
+# Локальная замена Bot API для нагрузочных прогонов.
+#
+# Понимает getUpdates (long polling), sendMessage, sendMediaGroup, send<Файл>, editMessageText,
+# answerCallbackQuery и ещё несколько служебных методов; остальное
+# отвечает {"ok": true, "result": true}. С вероятностью rate_429 любой
+# исходящий вызов получает 429 с retry_after, как настоящий Telegram.
+#
+#   python bench/fake_api.py --port 8081 --rate-429 0.01
+
+import argparse
+import asyncio
+import itertools
+import json
+import random
+import time
+from collections import Counter
+from typing import Any, Callable, Optional
+
+from aiohttp import web
+
+BOT_ID = 123456
+BOT_TOKEN = f"{BOT_ID}:FAKE-TOKEN"
+MAX_UPDATES_PER_POLL = 100
+
+# Методы, которые никогда не получают 429 (служебные и сам getUpdates)
+NO_THROTTLE = {"getUpdates", "getMe", "deleteWebhook", "setWebhook", "close", "logOut"}
+
+# Подписчик на исходящие вызовы бота: (метод, параметры, результат)
+Listener = Callable[[str, dict, Any], None]
+
+
+# aiogram шлёт сложные поля строкой JSON
+JSON_FIELDS = {"reply_markup", "entities", "allowed_updates", "link_preview_options", "reply_parameters", "media"}
+
+# Отправка файла по file_id: в ответ — сообщение бота без содержимого
+SEND_MEDIA_METHODS = {
+    "sendPhoto", "sendVideo", "sendAnimation", "sendDocument",
+    "sendAudio", "sendVoice", "sendVideoNote", "sendSticker",
+}
+
+
+def _decode(params: dict) -> dict:
+    return {
+        key: json.loads(value) if key in JSON_FIELDS and isinstance(value, str) else value
+        for key, value in params.items()
+    }
+
+
+class FakeBotAPI:
+    def __init__(self, rate_429: float = 0.0, retry_after: int = 1, seed: int = 0):
+        self.rate_429 = rate_429
+        self.retry_after = retry_after
+        self._rnd = random.Random(seed)
+        self._updates: list[dict] = []
+        self._has_updates = asyncio.Event()
+        self._update_ids = itertools.count(1)
+        self._message_ids = itertools.count(1)
+        self._listeners: list[Listener] = []
+        self.calls: Counter[str] = Counter()
+        self.throttled: Counter[str] = Counter()
+
+    # ---------- входящие апдейты ----------
+
+    def on_call(self, listener: Listener):
+        self._listeners.append(listener)
+
+    def next_message_id(self) -> int:
+        return next(self._message_ids)
+
+    def push_update(self, update: dict) -> int:
+        update_id = next(self._update_ids)
+        self._updates.append({"update_id": update_id, **update})
+        self._has_updates.set()
+        return update_id
+
+    def push_message(self, user: dict, text: str, reply_to: Optional[dict] = None) -> int:
+        message = {
+            "message_id": self.next_message_id(),
+            "date": int(time.time()),
+            "chat": {"id": user["id"], "type": "private"},
+            "from": user,
+            "text": text,
+        }
+        if reply_to is not None:
+            message["reply_to_message"] = reply_to
+        return self.push_update({"message": message})
+
+    def push_callback(self, user: dict, message: dict, data: str) -> int:
+        return self.push_update({
+            "callback_query": {
+                "id": str(next(self._update_ids)),
+                "from": user,
+                "chat_instance": str(user["id"]),
+                "message": message,
+                "data": data,
+            }
+        })
+
+    @property
+    def pending_updates(self) -> int:
+        return len(self._updates)
+
+    # ---------- HTTP ----------
+
+    def app(self) -> web.Application:
+        app = web.Application()
+        app.router.add_route("*", "/bot{token}/{method}", self._handle)
+        return app
+
+    async def _handle(self, request: web.Request) -> web.Response:
+        method = request.match_info["method"]
+        params = dict(await request.post()) if request.can_read_body else {}
+        params = _decode({**request.query, **params})
+        self.calls[method] += 1
+
+        if method not in NO_THROTTLE and self.rate_429 and self._rnd.random() < self.rate_429:
+            self.throttled[method] += 1
+            return web.json_response({
+                "ok": False,
+                "error_code": 429,
+                "description": f"Too Many Requests: retry after {self.retry_after}",
+                "parameters": {"retry_after": self.retry_after},
+            }, status=429)
+
+        if method == "getUpdates":
+            result = await self._get_updates(params)
+        else:
+            result = self._result(method, params)
+            for listener in self._listeners:
+                listener(method, params, result)
+        return web.json_response({"ok": True, "result": result})
+
+    async def _get_updates(self, params: dict) -> list[dict]:
+        offset = int(params.get("offset") or 0)
+        if offset:
+            self._updates = [u for u in self._updates if u["update_id"] >= offset]
+        if not self._updates:
+            self._has_updates.clear()
+            timeout = float(params.get("timeout") or 0)
+            try:
+                await asyncio.wait_for(self._has_updates.wait(), timeout)
+            except asyncio.TimeoutError:
+                return []
+        return self._updates[:MAX_UPDATES_PER_POLL]
+
+    def _bot_message(self, chat_id: int, **fields: Any) -> dict:
+        return {
+            "message_id": self.next_message_id(),
+            "date": int(time.time()),
+            "chat": {"id": chat_id, "type": "private"},
+            "from": {"id": BOT_ID, "is_bot": True, "first_name": "FakeBot"},
+            **fields,
+        }
+
+    def _result(self, method: str, params: dict) -> Any:
+        if method == "getMe":
+            return {"id": BOT_ID, "is_bot": True, "first_name": "FakeBot", "username": "fake_bot"}
+        if method == "sendMessage":
+            message = self._bot_message(int(params["chat_id"]), text=params.get("text", ""))
+            if isinstance(params.get("reply_markup"), dict) and "inline_keyboard" in params["reply_markup"]:
+                message["reply_markup"] = params["reply_markup"]
+            return message
+        if method == "sendMediaGroup":
+            return [self._bot_message(int(params["chat_id"])) for _ in params.get("media") or ()]
+        if method in SEND_MEDIA_METHODS:
+            return self._bot_message(int(params["chat_id"]))
+        if method == "editMessageText":
+            return {
+                "message_id": int(params.get("message_id") or 0),
+                "date": int(time.time()),
+                "chat": {"id": int(params.get("chat_id") or 0), "type": "private"},
+                "text": params.get("text", ""),
+            }
+        return True
+
+
+async def serve(api: FakeBotAPI, host: str, port: int) -> web.AppRunner:
+    runner = web.AppRunner(api.app())
+    await runner.setup()
+    await web.TCPSite(runner, host, port).start()
+    return runner
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Fake Telegram Bot API server")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8081)
+    parser.add_argument("--rate-429", type=float, default=0.0, help="share of calls answered with 429")
+    parser.add_argument("--retry-after", type=int, default=1)
+    return parser.parse_args(argv)
+
+
+async def main(argv=None):
+    args = parse_args(argv)
+    api = FakeBotAPI(args.rate_429, args.retry_after)
+    await serve(api, args.host, args.port)
+    print(f"fake Bot API on http://{args.host}:{args.port}, token {BOT_TOKEN}")
+    await asyncio.Event().wait()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
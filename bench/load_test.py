@@ -0,0 +1,306 @@
+# Сквозной нагрузочный прогон: настоящий app.main.main() против bench/fake_api.py.
+#
+#   python bench/load_test.py --users 2000 --rate 100
+#   python bench/load_test.py --users 5000 --rate 300 --unthrottled --rate-429 0.01 --out load.json
+#
+# Виртуальные игроки проходят /start → FAQ → создание заявки → проверка статуса,
+# «админ» отвечает на часть заявок reply-сообщением и закрывает их кнопкой tclose.
+# Бот, фейковый API и драйвер работают в одном процессе, поэтому RSS в отчёте —
+# общий; для оценки роста важна динамика, а не абсолютное значение.
+
+import argparse
+import asyncio
+import contextlib
+import json
+import logging
+import os
+import random
+import re
+import signal
+import sys
+import tempfile
+import time
+from collections import defaultdict
+from typing import Optional
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, "bench"))
+
+from fake_api import FakeBotAPI, BOT_TOKEN, serve  # noqa: E402
+
+ADMIN_ID = 1
+USER_ID_BASE = 10_000_000
+STEP_TIMEOUT_SEC = 30
+TICKET_ID_RE = re.compile(r"#(\d+)")
+
+
+def _rss_mb() -> float:
+    with contextlib.suppress(OSError):
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) / 1024
+    import resource
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def _percentile(sorted_values: list[float], q: float) -> float:
+    if not sorted_values:
+        return 0.0
+    idx = min(len(sorted_values) - 1, max(0, round(q * (len(sorted_values) - 1))))
+    return sorted_values[idx]
+
+
+def _summary(values: list[float]) -> dict:
+    values = sorted(values)
+    return {
+        "n": len(values),
+        "p50_ms": round(_percentile(values, 0.50) * 1000, 2),
+        "p90_ms": round(_percentile(values, 0.90) * 1000, 2),
+        "p99_ms": round(_percentile(values, 0.99) * 1000, 2),
+        "max_ms": round(values[-1] * 1000, 2) if values else 0.0,
+    }
+
+
+class LoadDriver:
+    def __init__(self, api: FakeBotAPI, args):
+        self.api = api
+        self.args = args
+        self.rnd = random.Random(args.seed)
+        self.latency: dict[str, list[float]] = defaultdict(list)
+        self.timeouts: dict[str, int] = defaultdict(int)
+        self.steps_done = 0
+        self.users_done = 0
+        # ответ бота на шаг игрока: chat_id -> future с текстом
+        self._waiting: dict[int, asyncio.Future] = {}
+        # уведомления игроку после действий админа: (chat_id, ticket_id, вид) -> время действия
+        self._notices: dict[tuple[int, int, str], float] = {}
+        self._admin_tasks: set[asyncio.Task] = set()
+        self.admin = {"id": ADMIN_ID, "is_bot": False, "first_name": "Admin"}
+        api.on_call(self._on_bot_call)
+
+    # ---------- ответы бота ----------
+
+    def _on_bot_call(self, method: str, params: dict, result):
+        if method != "sendMessage":
+            return
+        chat_id = int(params["chat_id"])
+        text = params.get("text", "")
+        now = time.perf_counter()
+
+        if chat_id == ADMIN_ID:
+            if "Новая заявка" in text and self.rnd.random() < self.args.admin_share:
+                self._spawn_admin(result)
+            return
+
+        kind = "admin_reply" if text.startswith("✉️ Ответ по заявке") else (
+            "admin_close" if text.startswith("✅ Ваша заявка") else None
+        )
+        if kind is not None:
+            match = TICKET_ID_RE.search(text)
+            started = self._notices.pop((chat_id, int(match.group(1)), kind), None) if match else None
+            if started is not None:
+                self.latency[kind].append(now - started)
+            return
+
+        future = self._waiting.pop(chat_id, None)
+        if future is not None and not future.done():
+            future.set_result(text)
+
+    # ---------- игроки ----------
+
+    async def _step(self, user: dict, text: str, name: str) -> Optional[str]:
+        future = asyncio.get_running_loop().create_future()
+        self._waiting[user["id"]] = future
+        started = time.perf_counter()
+        self.api.push_message(user, text)
+        try:
+            reply = await asyncio.wait_for(future, STEP_TIMEOUT_SEC)
+        except asyncio.TimeoutError:
+            self._waiting.pop(user["id"], None)
+            self.timeouts[name] += 1
+            return None
+        self.latency[name].append(time.perf_counter() - started)
+        self.steps_done += 1
+        return reply
+
+    async def user_flow(self, n: int):
+        user = {"id": USER_ID_BASE + n, "is_bot": False, "first_name": f"Player{n}", "username": f"player{n}"}
+        await self._step(user, "/start", "start")
+        await self._step(user, "📚 FAQ", "faq")
+        await self._step(user, "🆘 Создать обращение", "ticket_open")
+        reply = await self._step(user, f"Нагрузочный тест, игрок {n}: не могу зайти на сервер", "ticket_submit")
+        match = TICKET_ID_RE.search(reply or "")
+        if match:
+            await self._step(user, "📌 Статус заявки", "status_open")
+            await self._step(user, match.group(1), "status_check")
+        self.users_done += 1
+
+    # ---------- админ ----------
+
+    def _spawn_admin(self, card: dict):
+        task = asyncio.create_task(self._admin_flow(card))
+        self._admin_tasks.add(task)
+        task.add_done_callback(self._admin_tasks.discard)
+
+    async def _admin_flow(self, card: dict):
+        match = TICKET_ID_RE.search(card["text"])
+        user_match = re.search(r"От: (\d+)", card["text"])
+        if not match or not user_match:
+            return
+        tid, user_id = int(match.group(1)), int(user_match.group(1))
+
+        await asyncio.sleep(self.rnd.uniform(0, self.args.admin_delay))
+        self._notices[(user_id, tid, "admin_reply")] = time.perf_counter()
+        self.api.push_message(self.admin, f"Ответ на заявку {tid}", reply_to=card)
+
+        await asyncio.sleep(self.rnd.uniform(0, self.args.admin_delay))
+        self._notices[(user_id, tid, "admin_close")] = time.perf_counter()
+        self.api.push_callback(self.admin, card, f"tclose:{tid}")
+
+    async def drain_admin(self, timeout: float):
+        if self._admin_tasks:
+            await asyncio.wait(list(self._admin_tasks), timeout=timeout)
+        # даём боту дослать уведомления по последним действиям
+        deadline = time.perf_counter() + timeout
+        while self._notices and time.perf_counter() < deadline:
+            await asyncio.sleep(0.1)
+
+
+async def sample_loop(driver: LoadDriver, timeline: list, started: float, every: float, extra):
+    last_steps = 0
+    while True:
+        await asyncio.sleep(every)
+        steps = driver.steps_done
+        timeline.append({
+            "t": round(time.perf_counter() - started, 1),
+            "rss_mb": round(_rss_mb(), 1),
+            "steps_per_sec": round((steps - last_steps) / every, 1),
+            "users_done": driver.users_done,
+            "pending_updates": driver.api.pending_updates,
+            **extra(),
+        })
+        last_steps = steps
+        print(json.dumps(timeline[-1], ensure_ascii=False), file=sys.stderr)
+
+
+def configure_bot(args, api_url: str, db_path: str):
+    # Настройки подменяются атрибутами модулей до запуска main()
+    from app import main as bot_main, db as bot_db, outbox as bot_outbox
+
+    bot_db.DB_PATH = db_path
+    bot_main.BOT_TOKEN = BOT_TOKEN
+    bot_main.ADMIN_ID = ADMIN_ID
+    bot_main.BOT_API_SERVER = api_url
+    bot_main.WEBHOOK_URL = ""
+    bot_main.QUEUE_BOARD = False
+    bot_main.METRICS_LISTEN_PORT = args.metrics_port
+    if args.unthrottled:
+        # без лимитов Bot API: меряем сам бот, а не GLOBAL_RATE
+        bot_outbox.CHAT_RATE = bot_outbox.GROUP_RATE = 1e9
+        bot_outbox.outbox._global = bot_outbox.TokenBucket(1e9, 1e9)
+    return bot_main
+
+
+def _bot_extra():
+    from app.outbox import outbox
+    from app.scheduler import ticket_scheduler
+    from app.ratelimit import rate_limiter
+    from app.ticket_cache import ticket_cache
+    return {
+        "outbox_pending": outbox._pending,
+        "scheduler": len(ticket_scheduler),
+        "limiter": len(rate_limiter),
+        "ticket_cache": len(ticket_cache),
+    }
+
+
+async def run(args) -> dict:
+    logging.basicConfig(level=logging.WARNING)
+
+    api = FakeBotAPI(args.rate_429, args.retry_after, args.seed)
+    runner = await serve(api, "127.0.0.1", args.port)
+    workdir = tempfile.mkdtemp(prefix="load_")
+    bot_main = configure_bot(args, f"http://127.0.0.1:{args.port}", os.path.join(workdir, "bot.db"))
+
+    bot_task = asyncio.create_task(bot_main.main())
+    while not api.calls["getUpdates"]:
+        if bot_task.done():
+            await bot_task
+        await asyncio.sleep(0.05)
+
+    driver = LoadDriver(api, args)
+    timeline: list[dict] = []
+    started = time.perf_counter()
+    rss_start = _rss_mb()
+    sampler = asyncio.create_task(sample_loop(driver, timeline, started, args.sample_sec, _bot_extra))
+
+    users = []
+    for n in range(args.users):
+        users.append(asyncio.create_task(driver.user_flow(n)))
+        await asyncio.sleep(1 / args.rate)
+    await asyncio.gather(*users)
+    elapsed = time.perf_counter() - started
+    await driver.drain_admin(STEP_TIMEOUT_SEC)
+
+    sampler.cancel()
+    with contextlib.suppress(asyncio.CancelledError):
+        await sampler
+
+    # штатная остановка: start_polling ловит SIGTERM и main() проходит свой finally
+    os.kill(os.getpid(), signal.SIGTERM)
+    await bot_task
+    await runner.cleanup()
+
+    return {
+        "config": {
+            "users": args.users,
+            "rate": args.rate,
+            "admin_share": args.admin_share,
+            "rate_429": args.rate_429,
+            "unthrottled": args.unthrottled,
+        },
+        "duration_sec": round(elapsed, 2),
+        "users_per_sec": round(driver.users_done / elapsed, 1),
+        "steps_per_sec": round(driver.steps_done / elapsed, 1),
+        "latency": {name: _summary(values) for name, values in sorted(driver.latency.items())},
+        "timeouts": dict(driver.timeouts),
+        "unanswered_admin_actions": len(driver._notices),
+        "api_calls": dict(api.calls),
+        "api_throttled": dict(api.throttled),
+        "rss_mb": {"start": round(rss_start, 1), "end": round(_rss_mb(), 1)},
+        "timeline": timeline,
+    }
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="End-to-end load test against a fake Bot API")
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--rate", type=float, default=50, help="new virtual users per second")
+    parser.add_argument("--admin-share", type=float, default=0.5, help="share of tickets the admin answers and closes")
+    parser.add_argument("--admin-delay", type=float, default=2.0, help="max seconds before each admin action")
+    parser.add_argument("--rate-429", type=float, default=0.0)
+    parser.add_argument("--retry-after", type=int, default=1)
+    parser.add_argument("--unthrottled", action="store_true", help="lift outbox rate limits")
+    parser.add_argument("--port", type=int, default=8081)
+    parser.add_argument("--metrics-port", type=int, default=0)
+    parser.add_argument("--sample-sec", type=float, default=5)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--out", help="write JSON report here instead of stdout")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    report = asyncio.run(run(args))
+    text = json.dumps(report, ensure_ascii=False, indent=2)
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,19 @@
+import asyncio
+import os
+import sys
+
+import pytest
+
+# Модули app импортируются так же, как в bench/: по плоским именам
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, "app"))
+
+import db  # noqa: E402
+
+
+@pytest.fixture
+def db_path(tmp_path):
+    path = str(tmp_path / "bot.db")
+    db.DB_PATH = path
+    yield path
+    asyncio.run(db.close_db())
@@ -0,0 +1,95 @@
+import asyncio
+import os
+import random
+import sqlite3
+
+import pytest
+
+import db
+
+# Размер истории, на которой проверяются планы; TEST_PLAN_ROWS=10000 для быстрого прогона
+ROWS = int(os.environ.get("TEST_PLAN_ROWS", 1_000_000))
+OPEN_ROWS = 2000
+USERS = 50_000
+NOW = 1_700_000_000
+
+# Запросы из db.py, которые должны идти по индексам, а не сканировать tickets
+QUERIES = {
+    "list_open_tickets": (
+        "SELECT * FROM tickets WHERE status='open' ORDER BY id ASC LIMIT ?",
+        (200,),
+        "idx_tickets_status_id",
+    ),
+    "count_tickets_in_window": (
+        "SELECT COUNT(*) FROM tickets WHERE user_id=? AND created_ts>=?",
+        (42, NOW - 3600),
+        "idx_tickets_user_created",
+    ),
+    "submit_ticket_window": (
+        "SELECT COUNT(*), MIN(created_ts) FROM tickets WHERE user_id=? AND created_ts>=?",
+        (42, NOW - 3600),
+        "idx_tickets_user_created",
+    ),
+    "expire_tickets": (
+        "SELECT id FROM tickets WHERE status='open' AND created_ts<=? ORDER BY created_ts LIMIT ?",
+        (NOW - 1800, 500),
+        "idx_tickets_open_created",
+    ),
+    "list_open_tickets_of": (
+        "SELECT * FROM tickets WHERE assigned_to=? AND status='open' ORDER BY id",
+        (1,),
+        "idx_tickets_assigned_open",
+    ),
+}
+
+
+def _seed(path: str):
+    rnd = random.Random(ROWS)
+    con = sqlite3.connect(path)
+    con.execute("PRAGMA synchronous=OFF")
+
+    def rows():
+        for i in range(ROWS):
+            created_ts = NOW - (ROWS - i) * 30
+            status = "open" if i >= ROWS - OPEN_ROWS else "closed"
+            yield (rnd.randrange(1, USERS), "player", status, "Не могу зайти", created_ts, "-", rnd.randint(1, 4))
+
+    con.executemany(
+        """INSERT INTO tickets (user_id, username, status, message, created_ts, created_at, assigned_to)
+           VALUES (?, ?, ?, ?, ?, ?, ?)""",
+        rows()
+    )
+    con.commit()
+    con.execute("ANALYZE")
+    con.close()
+
+
+@pytest.fixture(scope="module")
+def history_db(tmp_path_factory):
+    path = str(tmp_path_factory.mktemp("plans") / "bot.db")
+    db.DB_PATH = path
+
+    async def create_schema():
+        await db.init_db()
+        await db.close_db()
+
+    asyncio.run(create_schema())
+    _seed(path)
+    con = sqlite3.connect(path)
+    yield con
+    con.close()
+
+
+@pytest.mark.parametrize("name", sorted(QUERIES))
+def test_query_uses_index(history_db, name):
+    sql, params, index = QUERIES[name]
+    plan = [row[3] for row in history_db.execute(f"EXPLAIN QUERY PLAN {sql}", params)]
+
+    assert any(index in step for step in plan), plan
+    assert not any(step.startswith("SCAN tickets") for step in plan), plan
+    assert not any("TEMP B-TREE" in step for step in plan), plan
+
+
+def test_migrations_are_recorded(history_db):
+    (version,) = history_db.execute("PRAGMA user_version").fetchone()
+    assert version == len(db.MIGRATIONS)
@@ -0,0 +1,62 @@
+import asyncio
+
+import db
+from ratelimit import RateLimiter, Rule, TICKET, CALL, COOLDOWN
+
+COOLDOWN_SEC = 60
+NOW = 1_700_000_000
+
+
+def _limiter() -> RateLimiter:
+    limiter = RateLimiter()
+    limiter.configure(TICKET, Rule(COOLDOWN_SEC, 600, 3))
+    limiter.configure(CALL, Rule(COOLDOWN_SEC))
+    return limiter
+
+
+async def _submit(user_id: int, ts: int) -> dict:
+    return await db.submit_ticket(
+        user_id=user_id, username=None, message="не могу зайти", created_ts=ts, created_at="-",
+        cooldown_sec=COOLDOWN_SEC, window_sec=600, max_per_window=3,
+    )
+
+
+def test_limiter_flush_does_not_block_submission(db_path):
+    async def scenario():
+        await db.init_db()
+        limiter = _limiter()
+        assert limiter.try_acquire(7, TICKET, NOW) == (None, 0)
+        assert limiter.try_acquire(7, CALL, NOW) == (None, 0)
+
+        # сброс лимитера успевает раньше группового коммита заявки
+        submit = asyncio.create_task(_submit(7, NOW))
+        await limiter.flush()
+        result = await submit
+        assert result["ticket_id"] is not None, result
+
+        limits = await db.get_user_limits(7)
+        assert limits["last_ticket_ts"] == NOW
+        assert limits["last_call_ts"] == NOW
+
+    asyncio.run(scenario())
+
+
+def test_rejected_submission_releases_limiter_hit(db_path):
+    async def scenario():
+        await db.init_db()
+        # заявка с другого процесса: в БД кулдаун уже идёт, лимитер о нём не знает
+        assert (await _submit(7, NOW))["ticket_id"] is not None
+
+        limiter = _limiter()
+        later = NOW + COOLDOWN_SEC // 2
+        assert limiter.try_acquire(7, TICKET, later) == (None, 0)
+        result = await _submit(7, later)
+        assert result["reason"] == COOLDOWN
+        limiter.release(7, TICKET, later)
+
+        # после кулдауна из БД лимитер не держит игрока ещё минуту
+        after = NOW + COOLDOWN_SEC
+        assert limiter.try_acquire(7, TICKET, after) == (None, 0)
+        assert (await _submit(7, after))["ticket_id"] is not None
+
+    asyncio.run(scenario())